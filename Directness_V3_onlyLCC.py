@@ -6,8 +6,18 @@ import numpy as np
 import os
 import time
 import osmnx as ox
-import random
 from multiprocessing import Pool
+from functools import partial
+from parallel import fork_map
+from distances import seed_distances
+from components import ComponentTracker
+from seeds import adaptive_seeds, cached_seeds
+from estimate import mean_error
+from sequence import MergeSequence, default_budgets
+from hierarchy import load_hierarchy
+from results import ResultWriter
+from routing import CSRGraph, DistanceMatrix, add_links, SeedDistances, pair_distances
+from telemetry import Telemetry
 '''
 Original Script Script to calculate the directness as the average percent difference in shortest path distances of bikes using bike lanes versus using streets.
 '''
@@ -19,6 +29,19 @@ ox.config(data_folder='../Data', logs_folder='../logs',
           log_file=True, log_filename='osmnx')
 now = datetime.datetime.now()
 
+#Script configs:
+sampler_seed = 0  # Seed of the random pairs of nodes, the same pairs are drawn in every run
+seed_cache = '../cache/seeds/'  # Folder of the cached pairs and street distances (see seeds.cached_seeds), None to compute them again
+compiled_graphs = True  # Run the shortest path searches on a CSR copy of the layers (routing.CSRGraph)
+matrix_nodes = 4000  # Bike layers with at most this many nodes keep the distances between all their nodes in a matrix updated with every new link (routing.DistanceMatrix), 0 to search the pairs
+search = 'dijkstra'  # Search of the bike distances, 'dijkstra', or 'astar' or 'alt' for one A* per pair (needs compiled_graphs)
+street_search = 'dijkstra'  # Search of the street distances, 'alt' reuses its landmarks for every pair, 'ch' uses a contraction hierarchy saved next to the drive graph file
+parallel_algorithms = False  # Run the algorithms of a city at the same time in forked workers sharing the layers, one city after another instead of the cities in a pool (only faster with fewer cities than cores)
+tolerance = None  # Half width of the 95% confidence intervals of d_ij_b (before the new links) and d_ij_s, seed pairs are added in batches until both are within it (seeds.adaptive_seeds), None for a fixed number of pairs
+incremental_paths = True  # Update the distances of the seed pairs with every new link instead of searching them again, in the layers larger than matrix_nodes
+
+result_columns = ['d_ij_b', 'd_ij_s', 'se_b', 'n_b', 'se_s', 'n_s']  # Columns added to the sequence in the output files
+
 # Working functions
 
 
@@ -88,57 +111,50 @@ def load_df(name, algorithm):
     #                      lineterminator='n', index_col=0)
 
     #Uncomment to load bike + street data:
-    if algorithm == 'greedy_LCC':
-        df = pd.read_csv('../Data/bike_streets/filter/outputs/{}_CC_data_L2S.csv'.format(name), lineterminator='n', index_col=0)
-    elif algorithm == 'random':
-        df = pd.read_csv('../Data/bike_streets/filter/outputs/{}_CC_data_R2C.csv'.format(name),
-                         lineterminator='n', index_col=0)
-    elif algorithm == 'min_delta':
-        df = pd.read_csv('../Data/bike_streets/filter/outputs/{}_CC_data_CC.csv'.format(name),
-                         lineterminator='n', index_col=0)
-    elif algorithm == 'greedy_min':
-        df = pd.read_csv('../Data/bike_streets/filter/outputs/{}_CC_data_L2C.csv'.format(name),
-                         lineterminator='n', index_col=0)
+    suffixes = {'greedy_LCC': 'L2S', 'random': 'R2C', 'min_delta': 'CC', 'greedy_min': 'L2C'}
+    sequence = MergeSequence.from_csv('../Data/bike_streets/filter/outputs/{}_CC_data_{}.csv'.format(name, suffixes[algorithm]))
+    # The sequences are saved up to a generous delta, keep the links of the original budget of the algorithm
+    df = sequence.truncate(default_budgets[algorithm]).copy()
     df['i'] = df.i.round(0).astype(int)
     df['j'] = df.j.round(0).astype(int)
     return df
 
 
-def get_seeds(G_bike, G_drive, pairs):
-    """Get x pairs of random pairs of nodes in the bike and street layer.
-
-    Parameters
-    ----------
-    G_bike : type
-        Description of parameter `G_bike`.
-    G_drive : type
-        Description of parameter `G_drive`.
-    pairs : type
-        Description of parameter `pairs`.
+def graph_files(name):
+    '''
+    Paths of the graph files read by load_graphs, their content is the key of the seed cache.
+    '''
+    return ['../Data/bike_streets/filter/{}/{}_bike.graphml'.format(name, name), '../Data/{}/{}_drive.graphml'.format(name, name)]
 
-    Returns
-    -------
-    type
-        Description of returned object.
 
-    """
-    seeds_bike = []
-    seeds_car = []
-    u = 0
-    for u in range(pairs):
-        i = random.choice(list(G_bike.nodes(data=True)))
-        j = random.choice(list(G_bike.nodes(data=True)))
-        u = ox.get_nearest_node(G_drive, (i[1]['y'], i[1]['x']))
-        v = ox.get_nearest_node(G_drive, (j[1]['y'], j[1]['x']))
-        if u != v or i[0] != j[0]:
-            seeds_car.append((u, v))
-            seeds_bike.append((i[0], j[0]))
-        else:
-            i = random.choice(list(G_bike.nodes(data=True)))
-            j = random.choice(list(G_bike.nodes(data=True)))
-            u = ox.get_nearest_node(G_drive, (i[1]['y'], i[1]['x']))
-            v = ox.get_nearest_node(G_drive, (j[1]['y'], j[1]['x']))
-    return seeds_bike, seeds_car
+def street_distances(G_drive, seeds_car, path=None):
+    '''
+    Travel distance of the seed pairs in the drive layer, inf without a path.
+    path: str graph file of the drive layer, where its contraction hierarchy is kept (street_search 'ch')
+    '''
+    if street_search == 'ch':
+        layer = load_hierarchy(G_drive, path)
+        distances = layer.pair_distances(seeds_car)
+    else:
+        layer = CSRGraph(G_drive) if compiled_graphs else G_drive
+        distances = pair_distances(layer, seeds_car, method=street_search)
+    if compiled_graphs or street_search == 'ch':
+        print('Street distances with {}: {} nodes settled'.format(street_search, layer.settled))
+    return distances
+
+
+def efficiencies(G_bike, G_drive, graph, components, seeds_bike, seeds_car, travel_distances):
+    '''
+    Efficiency (euclidean / travel distance) of every seed pair in the bike layer before the new links and in the
+    drive layer, the values averaged by d_ij_b and d_ij_s,
+    0 in the bike layer without a path and in the drive layer for pairs at distance 0.
+    graph: G_bike or its CSRGraph, components: its ComponentTracker
+    '''
+    distances = pair_distances(graph, seeds_bike, components, search)
+    bike = seed_distances(G_bike, seeds_bike) / distances
+    travel_distances = np.asarray(travel_distances, dtype=float)
+    street = np.divide(seed_distances(G_drive, seeds_car), travel_distances, out=np.zeros(len(seeds_car)), where=travel_distances > 0)
+    return [bike, street]
 
 
 def euclidean_dist_vec(y1, x1, y2, x2):
@@ -168,77 +184,97 @@ def get_lcc(G):
     return wcc[0]
 
 
-def get_travel_distance(G, u_v):
-    """Find the shortest path between two nodes and calculate the travel distance.
-
-    Parameters
-    ----------
-    G : nx.Graph
-        Networkx graph.
-    u_v : touple
-        Touple containing the origin and destination for the path.
-
-    Returns
-    -------
-    int
-        Distance for the path between 'u' to 'v'.
-
-    """
-    path = nx.shortest_path(G, u_v[0], u_v[1], weight='length')
-    distance = 0
-    for i, j in zip(path[:-1], path[1:]):
-        #distance += float(G[i][j][0]['length'])
-        try:
-            distance += float(G[i][j][0]['length'])
-        except:
-        #    pass
-            distance += euclidean_dist_vec(G.nodes[i]['y'],
-                                           G.nodes[i]['x'], G.nodes[j]['y'], G.nodes[j]['x'])
-    return distance
-
-
-def calculate_directness(df, G_bike, G_drive, name, algorithm, seeds_bike, car_value):
-
-    d_ij_b = []
-    d_ij_s = []
+def calculate_directness(df, G_bike, G_drive, name, algorithm, seeds_bike, car_value, incremental=None, graph=None, components=None, car_error=(np.nan, 0), writer=None):
+    '''
+    Average efficiency (euclidean / travel distance) of the seed pairs in the bike layer after every link of the sequence.
+    Bike layers of at most matrix_nodes nodes keep the distances between all their nodes (see routing.DistanceMatrix).
+    In larger layers, with incremental the distances of the pairs are updated with every new link (see routing.SeedDistances)
+    instead of searching the path of every pair again, the travel distances are the shortest path lengths.
+    With a writer (results.ResultWriter) every row is written once finished, the rows already in its file are skipped.
+    '''
+    incremental = incremental_paths if incremental is None else incremental
+    rows = []  # Results of the rows, when there is no writer
     print('Calculating {}'.format(name))
     start = time.time()
-    distances_ij = {}
-    for i_j in seeds_bike:
-        distances_ij[i_j] = 0
-    for ind, row in df.iterrows():
-        temp_start = time.time()
-        print('{} {}: {}/{}'.format(name, algorithm, ind, len(df)))
-        avg_bike = []
+    # The euclidean distance of the seeds doesn't change between iterations
+    euclidean = seed_distances(G_bike, seeds_bike)
+    if graph is None:
+        graph = CSRGraph(G_bike) if compiled_graphs else G_bike  # The links of the sequence are added to it
+    if components is None:
+        components = ComponentTracker(G_bike)  # Pairs in different components have no path, they are not searched
+    done = writer.rows if writer is not None else 0  # Rows finished by a previous run
+    if done > 0:  # Continue after them, their links are added at once
+        links = [(int(i), int(j)) for i, j in zip(df['i'].values[1:done], df['j'].values[1:done])]
+        for i, j in links:
+            components.union(i, j)
+        add_links(graph, links, seed_distances(G_bike, links))
+        print('{} {}: continuing from row {}/{}'.format(name, algorithm, done, len(df)))
+    records = {r[0]: r for r in df.itertuples(name=None)}  # Index and columns of the sequence of every row
+    matrix = DistanceMatrix(graph) if len(G_bike) <= matrix_nodes else None  # Small layers keep all their distances
+    incremental = incremental and matrix is None
+    if incremental:
+        paths = SeedDistances(graph, seeds_bike, components)
+
+    def current():
+        # Travel distance of the pairs in the layer with the links added so far
+        if matrix is not None:
+            return matrix.pair_distances(seeds_bike)
+        if incremental:
+            return paths.distances
+        return pair_distances(graph, seeds_bike, components, search)  # One search per origin, inf without a path
+
+    previous = current() if done > 0 else np.full(len(seeds_bike), np.inf)
+    seen = set()
+    repeated = np.array([i_j in seen or seen.add(i_j) for i_j in seeds_bike], dtype=bool)  # Pairs drawn twice
+    telemetry = Telemetry('Directness_V3_onlyLCC', name, algorithm, total=len(df), start=done)
+    for ind, row in df.iloc[done:].iterrows():
         if ind > 0:
-            G_bike.add_edge(int(row['i']), int(row['j']), length=euclidean_dist_vec(G_bike.nodes[int(row['i'])]['y'],
-                                                                          G_bike.nodes[int(row['i'])]['x'], G_bike.nodes[int(row['j'])]['y'], G_bike.nodes[int(row['j'])]['x']))
-        for i_j in seeds_bike:
-            euclidean_distance = euclidean_dist_vec(
-                G_bike.nodes[i_j[0]]['y'], G_bike.nodes[i_j[0]]['x'], G_bike.nodes[i_j[1]]['y'], G_bike.nodes[i_j[0]]['x'])
-            if distances_ij[i_j] != 0:
-                avg_bike.append(euclidean_distance/distances_ij[i_j])
-            if nx.has_path(G_bike, i_j[0], i_j[1]):
-                bike_distance = get_travel_distance(G_bike, i_j)
-                avg_bike.append(euclidean_distance/bike_distance)
-                distances_ij[i_j] = bike_distance
-            else:
-                avg_bike.append(0)
+            i, j = int(row['i']), int(row['j'])
+            length = euclidean_dist_vec(G_bike.nodes[i]['y'], G_bike.nodes[i]['x'], G_bike.nodes[j]['y'], G_bike.nodes[j]['x'])
+            with telemetry.phase('components'):
+                components.union(i, j)
+            with telemetry.phase('routing'):
+                if matrix is not None:
+                    matrix.add_edge(i, j, length=length)
+                elif incremental:
+                    paths.add_edge(i, j, length)
+                else:
+                    graph.add_edge(i, j, length=length)
+        with telemetry.phase('routing'):
+            bike = current()
+        # The ratio with the last distance stored for the pairs that had a path (a pair drawn twice already has
+        # the current one), and with the current distance of every pair, 0 without a path
+        stored = np.where(repeated, bike, previous)
+        avg_bike = np.concatenate([euclidean[stored < np.inf] / stored[stored < np.inf], euclidean / bike])
+        previous = bike
         bike_value = np.average(avg_bike)
-        d_ij_b.append(bike_value)
-        d_ij_s.append(car_value)
-        print('{} {} calculation {}/{} Efficiency: {}/{} done in {} s To go: {} min.'.format(name, algorithm, ind,
-                                                                                             len(df), round(bike_value, 3), round(car_value, 3), time.time()-temp_start, round(((len(df)-ind)*(time.time()-temp_start))/60, 3)))
-    df['d_ij_b'] = d_ij_b
-    df['d_ij_s'] = d_ij_s
+        values = [bike_value, car_value, mean_error(avg_bike)[1], len(avg_bike), car_error[0], car_error[1]]
+        with telemetry.phase('io'):
+            if writer is not None:
+                writer.write(list(records[ind]) + values)  # Flushed at once, a new run continues after it
+            else:
+                rows.append(values)
+        telemetry.iteration(ind, queue=len(df)-ind-1, efficiency=values[0], car=values[1])
+    telemetry.close()
+    if writer is not None:
+        df = writer.read()
+    else:
+        df = df.join(pd.DataFrame(rows, index=df.index, columns=result_columns))
     print('{} done in {} min'.format(name, round((time.time()-start)/60, 3)))
+    if isinstance(graph, CSRGraph):
+        print('{} {}: {} nodes settled with {}'.format(name, algorithm, graph.settled, search))
     return df
 
 
-def run_calculations(algorithm, G_bike_o, G_drive_o, name, seeds_bike, seeds_car, car_value):
+def run_calculations(algorithm, G_bike_o, G_drive_o, name, seeds_bike, seeds_car, car_value, base=None, components=None, car_error=(np.nan, 0)):
     start = time.time()
-    G_bike = G_bike_o.copy()
-    G_drive = G_drive_o.copy()
+    if base is None:
+        G_bike = G_bike_o.copy()
+        G_drive = G_drive_o.copy()
+        graph = None
+    else:  # Layers shared with the other algorithms, the links of this one go to an overlay of the compiled bike layer
+        G_bike, G_drive = G_bike_o, G_drive_o
+        graph = base.overlay()
 
     # Load the dataframe
 
@@ -249,9 +285,9 @@ def run_calculations(algorithm, G_bike_o, G_drive_o, name, seeds_bike, seeds_car
     assure_path_exists(data_path)
     print('{} {} data loaded in {}\n + Starting the calculations:'.format(name,
                                                                           algorithm, round(time.time()-start, 3)))
-    new_df = calculate_directness(df, G_bike, G_drive, name, algorithm, seeds_bike, car_value)
-    new_df.to_csv(data_path+'{}_{}.csv'.format(name, algorithm), sep=",", na_rep='', float_format=None, columns=None, header=True, index=True, index_label=None, mode='w', encoding=None,
-                  compression=None, quoting=None, quotechar='"', line_terminator='n', chunksize=None, tupleize_cols=None, date_format=None, doublequote=True, escapechar=None, decimal='.')
+    writer = ResultWriter(data_path+'{}_{}.csv'.format(name, algorithm), [''] + list(df.columns) + result_columns)
+    calculate_directness(df, G_bike, G_drive, name, algorithm, seeds_bike, car_value, graph=graph, components=components,
+                                  car_error=car_error, writer=writer)
     print('{} {} done in {} min.\n------------\n------------\n\n'.format(name,
                                                                          algorithm, round((time.time()-start)/60, 3)))
 
@@ -261,21 +297,33 @@ def main(name):
     algorithms = ['greedy_min', 'greedy_LCC', 'min_delta', 'random']  #
     G_bike_o, G_drive_o = load_graphs(name)
     print('{} data loaded'.format(name))
-    seeds_bike, seeds_car = get_seeds(G_bike_o, G_drive_o, 1000)
+    # Cached by the content of the graph files, reruns and the other Directness scripts reuse the pairs and the street distances
+    street = partial(street_distances, path=graph_files(name)[1])
+    if tolerance is None:
+        seeds_bike, seeds_car, travel_distances = cached_seeds(G_bike_o, G_drive_o, 1000, sampler_seed, graph_files(name), seed_cache, street)
+    else:  # As many pairs as the confidence intervals need, drawn in batches
+        graph = CSRGraph(G_bike_o) if compiled_graphs else G_bike_o
+        measure = partial(efficiencies, G_bike_o, G_drive_o, graph, ComponentTracker(G_bike_o))
+        seeds_bike, seeds_car, travel_distances = adaptive_seeds(G_bike_o, G_drive_o, tolerance, sampler_seed, graph_files(name),
+                                                                 measure, seed_cache, street)
     print('{} bike seeds, {} car seeds'.format(len(seeds_bike), len(seeds_car)))
     avg_street = []
-    for u_v in seeds_car:
-        euclidean_distance = euclidean_dist_vec(G_drive_o.nodes[u_v[0]]['y'],
-                                                G_drive_o.nodes[u_v[0]]['x'], G_drive_o.nodes[u_v[1]]['y'], G_drive_o.nodes[u_v[0]]['x'])
-        travel_distance = get_travel_distance(G_drive_o, u_v)
+    for u_v, euclidean_distance, travel_distance in zip(seeds_car, seed_distances(G_drive_o, seeds_car), travel_distances):
         if travel_distance > 0:
             avg_street.append(euclidean_distance/travel_distance)
         else:
             avg_street.append(0)
     car_value = np.average(avg_street)  # Average efficiency in the car layer
+    car_error = mean_error(avg_street)[1:]  # Standard error and number of pairs
     print('Calculations done fore cars, d_ij^s = {}'.format(car_value))
-    for algorithm in algorithms:
-        run_calculations(algorithm, G_bike_o, G_drive_o, name, seeds_bike, seeds_car, car_value)
+    if parallel_algorithms:
+        # The bike layer is compiled once and shared by the workers, each algorithm adds its links to an overlay
+        base = CSRGraph(G_bike_o) if compiled_graphs else None
+        fork_map(run_calculations, algorithms, (G_bike_o, G_drive_o, name, seeds_bike, seeds_car, car_value,
+                                                base, ComponentTracker(G_bike_o), car_error))
+    else:
+        for algorithm in algorithms:
+            run_calculations(algorithm, G_bike_o, G_drive_o, name, seeds_bike, seeds_car, car_value, car_error=car_error)
 
 
 if __name__ == '__main__':
@@ -298,7 +346,11 @@ if __name__ == '__main__':
               }
 
     print('Starting the script, go and grab a coffe, it is going to be a long one :)')
-    pool = Pool(processes=15)
-    pool.map(main, cities)
+    if parallel_algorithms:  # The cores go to the algorithms of one city at a time
+        for name in cities:
+            main(name)
+    else:
+        pool = Pool(processes=15)
+        pool.map(main, cities)
 
     print('All cities done in {} min'.format((time.time()-Global_start)/60))
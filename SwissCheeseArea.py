@@ -11,6 +11,8 @@ import networkx as nx
 import geopandas as gpd
 import datetime
 from multiprocessing import Pool
+from results import ResultWriter
+from telemetry import Telemetry
 
 # Confg osmnx
 ox.config(data_folder='../Data', logs_folder='../logs',
@@ -132,22 +134,22 @@ def main(name):
         print('{} {} data loaded in {}\n + Starting the calculations:'.format(name,
                                                                               algorithm, round(time.time()-start, 3)))
         area_total = area(G_drive)
-        coverage = []
-        for i, row in df.iterrows():
+        # Every row is written once finished, a new run continues after the rows already in the file
+        writer = ResultWriter(data_path+'{}_{}_coverage.csv'.format(name, algorithm), [''] + list(df.columns) + ['coverage'])
+        done = writer.rows
+        G_bike.add_edges_from((i, j) for i, j in zip(df['i'].values[:done].tolist(), df['j'].values[:done].tolist()) if i > 0 and j > 0)
+        records = {r[0]: r for r in df.itertuples(name=None)}
+        telemetry = Telemetry('SwissCheeseArea', name, algorithm, total=len(df), start=done)
+        for i, row in df.iloc[done:].iterrows():
             if row['i'] > 0 and row['j'] > 0:
                 G_bike.add_edge(row['i'], row['j'])
+            with telemetry.phase('coverage'):
                 b_temp = get_coverage(G_bike, 200)
-                coverage.append(b_temp/area_total)
-                print('{} {}: {}/{} Elapsed time: {} seg.'.format(name,
-                                                                  algorithm, i+1, len(df), round(time.time()-start, 3)))
-            else:
-                b_temp = get_coverage(G_bike, 200)
-                coverage.append(b_temp/area_total)
-                print('{} {}: {}/{} Elapsed time: {} seg.'.format(name,
-                                                                  algorithm, i+1, len(df), round(time.time()-start, 3)))
-        df['coverage'] = coverage
-        df.to_csv(data_path+'{}_{}.csv'.format(name, algorithm), sep=",", na_rep='', float_format=None, columns=None, header=True, index=True, index_label=None, mode='w', encoding=None,
-                  compression=None, quoting=None, quotechar='"', line_terminator='n', chunksize=None, tupleize_cols=None, date_format=None, doublequote=True, escapechar=None, decimal='.')
+            with telemetry.phase('io'):
+                writer.write(list(records[i]) + [b_temp/area_total])
+            telemetry.iteration(i, queue=len(df)-i-1, coverage=b_temp/area_total)
+        telemetry.close()
+        writer.close()
         print('{} {} done in {} min.\n------------\n------------\n\n'.format(name,
                                                                              algorithm, round((time.time()-start)/60, 3)))
 
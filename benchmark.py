@@ -0,0 +1,212 @@
+'''
+Benchmark of the merge strategies of connect_engine on synthetic layers shaped like the bike layers of the cities:
+random geometric graphs in projected coordinates, below the percolation threshold so they break into many
+small components. Every strategy is timed at increasing sizes, each case in a fresh process so the peak memory
+of one case does not leak into the next one, and the results are saved to a JSON file.
+
+python benchmark.py --sizes 2000 4000 8000
+python benchmark.py --compare old.json new.json
+'''
+from multiprocessing import Pool
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import time
+import networkx as nx
+import numpy as np
+from scipy.spatial import cKDTree
+import connect_engine
+from distances import paired_distances
+
+#Script configs:
+output_path = '../Data/benchmarks/'
+sizes = [1000, 2000, 4000, 8000, 16000]
+mean_degree = 2.0  # Expected links per node, the 2D random geometric graph percolates around 4.5
+density = 400.0  # Nodes per km2
+origin = (4500000.0, 400000.0)  # y, x of the corner of the layer, meters in a UTM like projection
+
+
+def synthetic_layer(n, seed=0, degree=None, nodes_km2=None):
+    '''
+    Random geometric graph with the shape of a fragmented bike layer.
+    Nodes are placed uniformly in a square in projected coordinates and every pair closer than the radius
+    giving the mean degree is linked in both directions, as osmnx does, with its length in meters.
+    ---
+    n: int number of nodes
+    seed: int seed of the generator, the same seed gives the same layer
+    degree: float mean degree, mean_degree by default
+    nodes_km2: float density of nodes, density by default
+
+    returns: nx.MultiDiGraph
+    '''
+    degree = mean_degree if degree is None else degree
+    nodes_km2 = density if nodes_km2 is None else nodes_km2
+    rng = np.random.default_rng(seed)
+    side = (n / nodes_km2) ** 0.5 * 1000
+    coords = rng.random((n, 2)) * side + np.array(origin)
+    radius = (degree * side ** 2 / (np.pi * n)) ** 0.5
+    pairs = cKDTree(coords).query_pairs(radius, output_type='ndarray')
+    lengths = paired_distances(coords[pairs[:, 0]], coords[pairs[:, 1]])
+    ids = (10**9 + rng.permutation(n)).tolist()  # OSM like ids, not in the order of the nodes
+    G = nx.MultiDiGraph()
+    G.add_nodes_from((ids[k], {'y': float(y), 'x': float(x)}) for k, (y, x) in enumerate(coords))
+    for (a, b), length in zip(pairs.tolist(), lengths.tolist()):
+        G.add_edge(ids[a], ids[b], length=length)
+        G.add_edge(ids[b], ids[a], length=length)
+    return G
+
+
+def _peak_rss_mb():
+    # Peak resident memory of this process, ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if platform.system() == 'Darwin' else peak / 2**10
+
+
+def run_case(case):
+    '''
+    Time one strategy on one synthetic layer.
+    ---
+    case: dict with the strategy name, the number of nodes n, the seed, the search method, the max_delta
+          (None for the whole sequence) and the workers of the closest pair searches (see connect_engine.ConnectEngine)
+
+    returns: dict with the case and its measures
+    '''
+    G = synthetic_layer(case['n'], case['seed'])
+    components = nx.number_weakly_connected_components(G)
+    random.seed(case['seed'])
+    base_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    engine = connect_engine.ConnectEngine(G, method=case['search'], workers=case['workers'])
+    load = time.perf_counter() - start
+    strategy = connect_engine.strategies[case['strategy']]()
+    stamps = []
+    next_link = strategy.next_link
+
+    def timed_next_link():
+        stamps.append(time.perf_counter())  # One stamp per iteration of the loop
+        return next_link()
+
+    strategy.next_link = timed_next_link
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        delta, nodes_cc, length_cc, i_s, j_s = engine.run(strategy, max_delta=np.inf if case['max_delta'] is None else case['max_delta'],
+                                                              telemetry=False)  # Only the strategy is timed
+    end = time.perf_counter()
+    engine.close()
+    links = len(delta) - 1
+    latency = np.diff(stamps + [end])[:links] * 1000 if links else np.zeros(1)
+    result = dict(case)
+    result.update({'components': components, 'links': links,
+                   'delta': float(delta[-1]), 'load_s': load, 'setup_s': (stamps[0] if stamps else end) - start,
+                   'total_s': end - start, 'latency_ms': {'mean': float(latency.mean()),
+                                                          'p50': float(np.percentile(latency, 50)),
+                                                          'p95': float(np.percentile(latency, 95)),
+                                                          'max': float(latency.max())},
+                   'peak_rss_mb': _peak_rss_mb(), 'run_rss_mb': _peak_rss_mb() - base_rss})
+    return result
+
+
+def scaling(results, measure):
+    '''
+    Scaling exponent of a measure with the number of nodes for every strategy, the slope of a least squares
+    fit in log-log scale (1 is linear, 2 quadratic).
+    ---
+    results: list of dicts from run_case
+    measure: str key of the measure, i.e. 'total_s'
+
+    returns: dict strategy -> exponent, None with less than two sizes
+    '''
+    exponents = {}
+    for name in sorted(set(r['strategy'] for r in results)):
+        points = [(r['n'], r[measure]) for r in results if r['strategy'] == name and r[measure] > 0]
+        if len(set(n for n, v in points)) < 2:
+            exponents[name] = None
+            continue
+        n, v = np.log(np.array(points, dtype=float)).T
+        exponents[name] = float(np.polyfit(n, v, 1)[0])
+    return exponents
+
+
+def compare(old_path, new_path):
+    '''
+    Print the ratio new / old of the total time and the peak memory of the cases in both files.
+    '''
+    with open(old_path) as f:
+        old = {(r['strategy'], r['n'], r['seed']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = json.load(f)['results']
+    print('{:<12}{:>8}{:>12}{:>12}{:>8}{:>12}{:>12}{:>8}'.format('strategy', 'n', 'old s', 'new s', 'x', 'old MB', 'new MB', 'x'))
+    for r in new:
+        o = old.get((r['strategy'], r['n'], r['seed']))
+        if o is None:
+            continue
+        print('{:<12}{:>8}{:>12.3f}{:>12.3f}{:>8.2f}{:>12.1f}{:>12.1f}{:>8.2f}'.format(
+            r['strategy'], r['n'], o['total_s'], r['total_s'], r['total_s'] / max(o['total_s'], 1e-9),
+            o['run_rss_mb'], r['run_rss_mb'], r['run_rss_mb'] / max(o['run_rss_mb'], 1e-9)))
+
+
+def main(sizes, algorithms=None, seed=0, search=None, max_delta=None, output=None, workers=None):
+    '''
+    Run every strategy at every size and save the results.
+    ---
+    sizes: list int number of nodes of the synthetic layers
+    algorithms: list names of the strategies, all of them by default
+    seed: int seed of the layers and of the random strategy
+    search: str closest pair search, 'kdtree' or 'brute', connect_engine.search by default
+    max_delta: float budget of new links, the whole sequence by default
+    output: str path of the JSON file, output_path/benchmark_{date}.json by default
+    workers: int processes of the closest pair searches of greedy_LCC, one by default
+
+    returns: str path of the JSON file
+    '''
+    algorithms = list(connect_engine.strategies) if algorithms is None else algorithms
+    search = connect_engine.search if search is None else search
+    now = datetime.datetime.now()
+    output = output_path + 'benchmark_{}.json'.format(now.strftime('%Y%m%d_%H%M%S')) if output is None else output
+    connect_engine.assure_path_exists(os.path.abspath(output))
+    cases = [{'strategy': a, 'n': n, 'seed': seed, 'search': search, 'max_delta': max_delta, 'workers': workers} for n in sizes for a in algorithms]
+    results = []
+    pool = Pool(processes=1, maxtasksperchild=1)  # A fresh process for every case
+    # The workers of the pool can't start the processes of the closest pair searches, these cases run here and
+    # their peak memory includes the previous cases
+    for result in map(run_case, cases) if workers is not None and workers > 1 else pool.imap(run_case, cases):
+        print('{} n={}: {} links in {} s, {} ms per link, {} MB'.format(result['strategy'], result['n'], result['links'],
+                                                                        round(result['total_s'], 3), round(result['latency_ms']['mean'], 3),
+                                                                        round(result['run_rss_mb'], 1)))
+        results.append(result)
+    pool.close()
+    pool.join()
+    report = {'date': now.isoformat(), 'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.machine(), 'cpus': os.cpu_count(),
+              'layer': {'mean_degree': mean_degree, 'density': density, 'origin': origin},
+              'results': results,
+              'scaling': {'total_s': scaling(results, 'total_s'), 'run_rss_mb': scaling(results, 'run_rss_mb')}}
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Scaling exponents of the total time: {}'.format(report['scaling']['total_s']))
+    print('Results saved in {}'.format(output))
+    return output
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the merge strategies on synthetic fragmented layers.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=sizes, help='number of nodes of the layers')
+    parser.add_argument('--algorithms', nargs='+', choices=sorted(connect_engine.strategies), default=None,
+                        help='strategies to run, all of them by default')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the layers and of the random strategy')
+    parser.add_argument('--search', choices=['kdtree', 'brute'], default=None, help='closest pair search')
+    parser.add_argument('--max-delta', type=float, default=None, help='budget of new links, the whole sequence by default')
+    parser.add_argument('--workers', type=int, default=None, help='processes of the closest pair searches of greedy_LCC')
+    parser.add_argument('--output', default=None, help='path of the JSON file with the results')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None,
+                        help='compare two result files instead of running the benchmark')
+    args = parser.parse_args()
+    if args.compare is not None:
+        compare(*args.compare)
+    else:
+        main(args.sizes, args.algorithms, args.seed, args.search, args.max_delta, args.output, args.workers)
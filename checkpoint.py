@@ -0,0 +1,82 @@
+'''
+Periodic checkpoints of the merge sequence of the connect components scripts.
+The sequence of links is enough to rebuild the components: connect_engine replays the links on its component
+tracker and the algorithm continues from the last saved iteration.
+'''
+import json
+import os
+import time
+
+
+def _to_json(value):
+    # numpy scalars (node ids, sizes) are not serializable by json
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+class Checkpoint(object):
+    '''
+    Save and restore the merge sequence (delta, nodes_cc, length_cc, i, j) of one city.
+    ---
+    path: str file where the checkpoint is stored
+    interval: float minimum number of seconds between two saves
+    '''
+
+    def __init__(self, path, interval=600):
+        self.path = path
+        self.interval = interval
+        self.last_save = time.time()
+
+    def save(self, delta, nodes_cc, length_cc, i_s, j_s, done=False, **extra):
+        '''
+        Atomically write the sequence to disk, the previous checkpoint is kept until the new one is complete.
+        ---
+        done: bool True once the algorithm reached the end of the sequence
+        extra: other json serializable state, i.e. the random state
+        '''
+        state = {'delta': delta, 'nodes_cc': nodes_cc, 'length_cc': length_cc,
+                 'i': i_s, 'j': j_s, 'done': done}
+        state.update(extra)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, default=_to_json)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.last_save = time.time()
+
+    def update(self, delta, nodes_cc, length_cc, i_s, j_s, **extra):
+        '''
+        Save the sequence if more than interval seconds passed since the last save.
+        '''
+        if time.time() - self.last_save >= self.interval:
+            self.save(delta, nodes_cc, length_cc, i_s, j_s, **extra)
+
+    def load(self):
+        '''
+        Read the last checkpoint.
+
+        returns: dict with the saved state, None if there is no checkpoint
+        '''
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def links(self, state):
+        '''
+        Links added in a saved sequence, skipping the initial row.
+        ---
+        state: dict loaded checkpoint
+
+        returns: list of (i, j) node ids
+        '''
+        return [(i, j) for i, j in zip(state['i'][1:], state['j'][1:]) if i != j]
+
+    def remove(self):
+        '''
+        Delete the checkpoint, i.e. once the final results are written.
+        '''
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,167 @@
+'''
+Disjoint-set (union-find) tracking of the weakly connected components of a graph.
+It is built once from the loaded graph and updated every time a new link joins two components,
+so the connect components scripts don't need to recompute the components in every iteration.
+'''
+import heapq
+
+
+def merge_bbox(a, b):
+    '''
+    Bounding box containing two bounding boxes (min_x, min_y, max_x, max_y).
+    '''
+    if a is None or b is None:
+        return a if b is None else b
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+class ComponentTracker(object):
+    '''
+    Keep the weakly connected components of a graph while new links are added to it.
+    ---
+    G: nx.Graph or nx.MultiDiGraph with the nodes and links already in the layer
+    by_position: bool if True components are tracked by the position of the nodes in G (0..n-1) instead of their ids
+
+    For every component (keyed by its root) it also keeps aggregates that are combined in O(1) on merge:
+    size (number of nodes), length (km of links, links without length count as 0) and
+    bbox (min_x, min_y, max_x, max_y of the nodes, None if the nodes have no coordinates).
+    Components are ranked by size and, for equal sizes, by the position of their first node in G,
+    which is the same order given by sorting nx.weakly_connected_component_subgraphs by length.
+    '''
+
+    def __init__(self, G, by_position=False):
+        self.parent = {}
+        self.size = {}
+        self.members = {}
+        self.first = {}
+        self.length = {}
+        self.bbox = {}
+        key = {}
+        for position, (n, d) in enumerate(G.nodes(data=True)):
+            key[n] = position if by_position else n
+            n = key[n]
+            self.parent[n] = n
+            self.size[n] = 1
+            self.members[n] = [n]
+            self.first[n] = position
+            self.length[n] = 0
+            self.bbox[n] = (d['x'], d['y'], d['x'], d['y']) if 'x' in d and 'y' in d else None
+        self.n_components = len(self.parent)
+        for u, v, d in G.edges(data=True):
+            self._link(key[u], key[v])
+            self.length[self.find(key[u])] += d.get('length', 0)/1000
+        self._heap = [(-self.size[r], self.first[r], r) for r in self.members]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        '''
+        Number of components in the graph.
+        '''
+        return self.n_components
+
+    def find(self, n):
+        '''
+        Get the root (component id) of one node.
+        ---
+        n: node id
+
+        returns: node id of the root of the component
+        '''
+        parent = self.parent
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]  # Path halving
+            n = parent[n]
+        return n
+
+    def connected(self, u, v):
+        '''
+        Check if two nodes are in the same component.
+        '''
+        return self.find(u) == self.find(v)
+
+    def _link(self, u, v):
+        ru = self.find(u)
+        rv = self.find(v)
+        if ru == rv:
+            return None
+        if self.size[ru] < self.size[rv]:
+            ru, rv = rv, ru
+        # Merge the smaller component into the larger one
+        self.parent[rv] = ru
+        self.size[ru] += self.size.pop(rv)
+        self.members[ru].extend(self.members.pop(rv))
+        self.first[ru] = min(self.first[ru], self.first.pop(rv))
+        self.length[ru] += self.length.pop(rv)
+        self.bbox[ru] = merge_bbox(self.bbox[ru], self.bbox.pop(rv))
+        self.n_components -= 1
+        return ru
+
+    def union(self, u, v, length=0):
+        '''
+        Record a new link between u and v, merging their components if they are different.
+        Call it next to every G.add_edge(u, v).
+        ---
+        u, v: node ids
+        length: float length of the new link in meters
+
+        returns: root of the merged component, None if u and v were already connected
+        '''
+        root = self._link(u, v)
+        if root is not None:
+            heapq.heappush(self._heap, (-self.size[root], self.first[root], root))
+            self.length[root] += length/1000
+        else:
+            self.length[self.find(u)] += length/1000
+        return root
+
+    def nodes(self, root):
+        '''
+        List of the nodes inside one component.
+        When two components merge, the nodes of the smaller one are appended after the nodes of the larger one.
+        ---
+        root: node id of the root of the component (see find)
+
+        returns: list of node ids
+        '''
+        return self.members[self.find(root)]
+
+    def _valid(self, entry):
+        size, first, root = entry
+        return self.parent[root] == root and self.size[root] == -size
+
+    def top(self, k):
+        '''
+        Get the k largest components without sorting all of them.
+        ---
+        k: int number of components
+
+        returns: list of roots, from the largest to the smallest
+        '''
+        heap = self._heap
+        found = []
+        while heap and len(found) < k:
+            entry = heapq.heappop(heap)
+            if self._valid(entry):
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(heap, entry)
+        return [entry[2] for entry in found]
+
+    def largest(self):
+        '''
+        Root of the largest component.
+        '''
+        return self.top(1)[0]
+
+    def second_largest(self):
+        '''
+        Root of the second largest component, None if the graph is connected.
+        '''
+        top = self.top(2)
+        return top[1] if len(top) > 1 else None
+
+    def ranking(self):
+        '''
+        Roots of all the components sorted from the largest to the smallest.
+        '''
+        return sorted(self.members, key=lambda r: (-self.size[r], self.first[r]))
@@ -0,0 +1,553 @@
+'''
+Engine to connect and analyze the different connected components on the bicycle layer of the cities.
+The nodes of the layer are loaded once into contiguous arrays and the components are merged following one
+of the strategies below, all of them sharing the same loop, component tracker and outputs:
+
+- greedy_min (L2C): connect the LCC with the closest node of any other component.
+- greedy_LCC (L2S): connect the two largest components.
+- min_delta (CC): connect the closest pair of nodes between any two components.
+- random (R2C): pick a random component and connect it with the closest component.
+
+Running this script computes the four sequences for every city over a single load of the graph.
+'''
+from multiprocessing import Pool
+from functools import partial
+import argparse
+import heapq
+import random
+import datetime
+import pandas as pd
+import numpy as np
+import os
+import time
+import osmnx as ox
+from scipy.spatial import cKDTree, Delaunay
+from components import ComponentTracker
+from checkpoint import Checkpoint
+from spatial import DeletableIndex, GridIndex
+import distances
+from parallel import ParallelSearch
+from sequence import default_budgets
+from telemetry import Silent, Telemetry
+
+#Script configs:
+output_path = '../Data/bike_streets/filter/outputs/'
+data_path = '../Data/bike_streets/filter/'
+checkpoint_interval = 600  # Seconds between two checkpoints of the merge sequence
+search = 'kdtree'  # Closest pair search between components: 'kdtree' or 'brute' (blocked distance matrix)
+max_block_bytes = 256 * 2**20  # Memory ceiling for one block of distances of the brute force search
+large_cities = ['LA', 'London', 'Jakarta']  # Run after the rest with --workers, splitting their search across processes
+sequence_max_delta = 1000000  # Meters of new links computed for every algorithm, smaller budgets are queried with sequence.MergeSequence
+
+# Confg osmnx
+ox.config(data_folder=data_path, logs_folder='../logs',
+          imgs_folder='../imgs', cache_folder='../cache',
+          use_cache=True, log_console=False, log_name='osmnx',
+          log_file=True, log_filename='osmnx')
+now = datetime.datetime.now()
+
+
+# Working functions
+def assure_path_exists(path):
+    '''
+    Check if the path to one folder exists and if not create it.
+    ---
+    path: str containing the path to check
+    '''
+    dir = os.path.dirname(path)
+    if not os.path.exists(dir):
+        os.makedirs(dir)
+
+
+def load_graph(name, layer):
+    '''
+    Load the graph into the script.
+    ---
+    name: str name of the city to be loaded
+    layer: str layer to be loaded, it can be: drive, bike, walk, rail.
+
+    returns: Networkx MultiDiGraph
+    '''
+    return ox.load_graphml('{}/{}_{}.graphml'.format(name, name, layer))
+
+
+def euclidean_dist_vec(y1, x1, y2, x2):
+    '''
+    Calculate the euclidean distance between two points, works with floats and np.arrays.
+    '''
+    distance = ((x1 - x2) ** 2 + (y1 - y2) ** 2) ** 0.5
+    return distance
+
+
+def closest_between(coords, a, b, method='kdtree'):
+    '''
+    Find the closest pair of nodes between two groups of nodes.
+    With 'kdtree' a KD-tree is built over the larger group and queried with the smaller one, every pair
+    within rounding distance of the minimum is re-measured with euclidean_dist_vec. With 'brute' the
+    distances are computed in memory bounded blocks (see distances.py). In both cases ties are resolved
+    by the order of the nodes in a, then in b, as a loop over a and then over b would do.
+    ---
+    coords: np.array (n, 2) y, x coordinates of all the nodes
+    a, b: np.array positions of the nodes of each group
+    method: str 'kdtree' or 'brute'
+
+    returns: tuple position in a, position in b and distance, None if a group is empty
+    '''
+    if len(a) == 0 or len(b) == 0:
+        return None
+    if method == 'brute':
+        k_a, k_b, d = distances.closest_pair(coords[a], coords[b], max_block_bytes)
+        p, q = coords[a[k_a]], coords[b[k_b]]
+        return a[k_a], b[k_b], euclidean_dist_vec(float(p[0]), float(p[1]), float(q[0]), float(q[1]))
+    swap = len(b) > len(a)
+    big, small = (b, a) if swap else (a, b)
+    tree = cKDTree(coords[big])
+    dist, _ = tree.query(coords[small])
+    radius = dist.min() * (1 + 1e-9) + 1e-12  # Tolerance for the rounding of the tree distances
+    candidates = []
+    for s in np.flatnonzero(dist <= radius):
+        for t in tree.query_ball_point(coords[small[s]], radius):
+            k_a, k_b = (s, t) if swap else (t, s)
+            p, q = coords[a[k_a]], coords[b[k_b]]
+            candidates.append((euclidean_dist_vec(float(p[0]), float(p[1]), float(q[0]), float(q[1])), k_a, k_b))
+    d, k_a, k_b = min(candidates)
+    return a[k_a], b[k_b], d
+
+
+def delaunay_links(coords):
+    '''
+    Candidate links for the euclidean minimum spanning tree of a set of points.
+    Any closest pair between two components is an edge of the Delaunay triangulation, so these
+    links are enough to reproduce the min_delta sequence.
+    ---
+    coords: np.array with shape (n, 2)
+
+    returns: np.array with shape (m, 2) with the positions of the nodes of every link
+    '''
+    uniq, first, inverse = np.unique(coords, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Nodes sharing the same coordinates are linked to the first node at that position
+    rep = first[inverse]
+    dup = np.flatnonzero(rep != np.arange(len(coords)))
+    links = [np.column_stack([rep[dup], dup])]
+    if len(uniq) == 2:
+        links.append(first[np.array([[0, 1]])])
+    elif len(uniq) > 2:
+        try:
+            tri = Delaunay(uniq)
+            simplices = tri.simplices
+            edges = np.vstack([simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [0, 2]]])
+            edges.sort(axis=1)
+            links.append(first[np.unique(edges, axis=0)])
+            if len(tri.coplanar) > 0:  # Points left out by qhull, link them to their closest vertex
+                links.append(first[tri.coplanar[:, [0, 2]]])
+        except RuntimeError:  # All the points are collinear, the sorted neighbours are the candidates
+            links.append(first[np.column_stack([np.arange(len(uniq)-1), np.arange(1, len(uniq))])])
+    return np.vstack(links).astype(int)
+
+
+# Merge strategies
+class MergeStrategy(object):
+    '''
+    Rule to choose the next link between two components.
+    ---
+    name: str name of the algorithm, as used by the Directness scripts
+    suffix: str suffix of the output file, {city}_CC_data_{suffix}.csv
+    record: str 'top2' to record the nodes and km of the two largest components before each merge,
+            'lcc' to record the nodes and km of the largest component after the merge
+    budget: float budget of new links of the original runs of the algorithm, see sequence.default_budgets
+    absorbs: bool merged reads the nodes of the component of j, they are only listed for the strategies that need them
+    '''
+    name = None
+    suffix = None
+    record = 'lcc'
+    budget = None
+    absorbs = False
+
+    def start(self, engine, tracker):
+        '''
+        Prepare the strategy for the current components of the layer.
+        ---
+        engine: ConnectEngine with the coordinates of the nodes
+        tracker: ComponentTracker over the positions of the nodes
+        '''
+        self.engine = engine
+        self.tracker = tracker
+
+    def next_link(self):
+        '''
+        Choose the next link.
+
+        returns: tuple positions of the nodes i and j and distance, None if there is nothing to connect
+        '''
+        raise NotImplementedError
+
+    def merged(self, i, j, absorbed):
+        '''
+        Update the strategy after the link (i, j) has been added.
+        ---
+        absorbed: list positions of the nodes of the component of j before the merge, None unless absorbs
+        '''
+        pass
+
+    def get_state(self):
+        '''
+        Extra state to save in the checkpoints.
+        '''
+        return {}
+
+    def set_state(self, state):
+        '''
+        Restore the extra state saved in a checkpoint.
+        '''
+        pass
+
+
+class GreedyMin(MergeStrategy):
+    '''
+    Connect the LCC with the closest node of any other component.
+    Every LCC node keeps in a heap its closest node outside the LCC, found in a deletable spatial
+    index of the nodes not yet in the LCC. When a component joins the LCC its nodes are removed from
+    the index and only they are queried against the remaining nodes. Heap entries pointing to a node
+    that already joined the LCC are a lower bound of the new distance, so they are re-queried when
+    they reach the top of the heap.
+    '''
+    name = 'greedy_min'
+    suffix = 'L2C'
+    record = 'top2'
+    budget = default_budgets['greedy_min']
+    absorbs = True
+
+    def start(self, engine, tracker):
+        MergeStrategy.start(self, engine, tracker)
+        self.index = DeletableIndex(engine.coords)
+        self.heap = []
+        self._absorb(tracker.nodes(tracker.largest()))
+
+    def _absorb(self, members):
+        # Take the new LCC nodes out of the index and queue their closest candidates
+        idx = np.array(members, dtype=int)
+        self.index.remove(idx)
+        dist, found = self.index.query(self.engine.coords[idx])
+        for d, a, b in zip(dist, idx, found):
+            if b >= 0:
+                heapq.heappush(self.heap, (d, a, b))
+
+    def next_link(self):
+        heap = self.heap
+        while heap:
+            d, a, b = heap[0]
+            if self.index.alive[b]:
+                return a, b, self.engine.distance(a, b)
+            heapq.heappop(heap)  # The candidate already joined the LCC, look for a new one
+            dist, found = self.index.query(self.engine.coords[a])
+            if found[0] >= 0:
+                heapq.heappush(heap, (dist[0], a, found[0]))
+        return None
+
+    def merged(self, i, j, absorbed):
+        self._absorb(absorbed)
+
+
+class GreedyLCC(MergeStrategy):
+    '''
+    Connect the two largest components with a KD-tree closest pair search.
+    '''
+    name = 'greedy_LCC'
+    suffix = 'L2S'
+    record = 'top2'
+    budget = default_budgets['greedy_LCC']
+
+    def next_link(self):
+        top = self.tracker.top(2)
+        if len(top) < 2:
+            return None
+        a = np.array(self.tracker.nodes(top[0]), dtype=int)
+        b = np.array(self.tracker.nodes(top[1]), dtype=int)
+        return self.engine.closest(a, b)
+
+
+class MinDelta(MergeStrategy):
+    '''
+    Connect the closest pair of nodes between any two components.
+    The sequence is Kruskal over the inter-component distances: the Delaunay links are sorted by
+    length once and added in order, skipping those inside a component, O(n log n) for the whole run.
+    '''
+    name = 'min_delta'
+    suffix = 'CC'
+    budget = default_budgets['min_delta']
+
+    def start(self, engine, tracker):
+        MergeStrategy.start(self, engine, tracker)
+        coords = engine.coords
+        self.links = delaunay_links(coords)
+        self.dist = euclidean_dist_vec(coords[self.links[:, 0], 0], coords[self.links[:, 0], 1],
+                                       coords[self.links[:, 1], 0], coords[self.links[:, 1], 1])
+        self.order = iter(np.lexsort((self.links[:, 1], self.links[:, 0], self.dist)))
+
+    def next_link(self):
+        for k in self.order:
+            i, j = self.links[k]
+            if not self.tracker.connected(i, j):
+                return i, j, float(self.dist[k])
+        return None
+
+
+class RootSampler(object):
+    '''
+    Fenwick tree over the positions of the nodes that are roots of a component.
+    It picks the k-th root in position order in O(log n), so a uniform random component can be drawn
+    without sorting the components, and the choice only depends on the current components.
+    ---
+    n: int number of nodes
+    roots: list positions of the current roots
+    '''
+
+    def __init__(self, n, roots):
+        self.tree = [0] * (n + 1)
+        for r in roots:
+            self.add(r, 1)
+        self.step = 1 << n.bit_length()
+
+    def add(self, position, value):
+        k = position + 1
+        while k < len(self.tree):
+            self.tree[k] += value
+            k += k & -k
+
+    def kth(self, k):
+        '''
+        Position of the k-th root (0 based).
+        '''
+        position = 0
+        step = self.step
+        while step:
+            nxt = position + step
+            if nxt < len(self.tree) and self.tree[nxt] <= k:
+                position = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return position
+
+
+class RandomClosest(MergeStrategy):
+    '''
+    Pick a random component and connect it with the closest node of any other component.
+    The nodes are in a grid index tagged with their component, every node of the picked component
+    looks for the closest node of another component by expanding rings of cells, bounded by the best
+    distance found so far, and a component larger than the rest queries a KD-tree of the other nodes
+    (see GridIndex.closest_foreign). Labels are updated merging the smaller component into the larger one.
+    '''
+    name = 'random'
+    suffix = 'R2C'
+    budget = default_budgets['random']
+
+    def start(self, engine, tracker):
+        MergeStrategy.start(self, engine, tracker)
+        n = len(engine.coords)
+        self.grid = GridIndex(engine.coords, [tracker.find(p) for p in range(n)])
+        self.roots = RootSampler(n, list(tracker.members))
+
+    def next_link(self):
+        tracker = self.tracker
+        if len(tracker) < 2:
+            return None
+        self.pick = self.roots.kth(random.randrange(len(tracker)))  # Pick a random component
+        self.members = list(tracker.nodes(self.pick))
+        best, i, j = self.grid.closest_foreign(self.members)
+        return i, j, self.engine.distance(i, j)
+
+    def merged(self, i, j, absorbed):
+        # Labels are the roots of the tracker, relabel the component that lost its root. When the picked one
+        # kept it, the nodes of the other are the ones after its members (see ComponentTracker.nodes)
+        root = self.tracker.find(i)
+        root_j = self.grid.labels[j]
+        if root == self.pick:
+            self.grid.relabel(self.tracker.nodes(root)[len(self.members):], root)
+            self.roots.add(root_j, -1)
+        else:
+            self.grid.relabel(self.members, root)
+            self.roots.add(self.pick, -1)
+
+    def get_state(self):
+        return {'random_state': random.getstate()}
+
+    def set_state(self, state):
+        s = state['random_state']
+        random.setstate((s[0], tuple(s[1]), s[2]))
+
+
+strategies = {s.name: s for s in [GreedyMin, GreedyLCC, MinDelta, RandomClosest]}
+
+
+class ConnectEngine(object):
+    '''
+    Nodes of a layer in contiguous arrays, shared by all the merge strategies.
+    ---
+    G: nx.MultiDiGraph layer, it is not modified by the engine
+    method: str closest pair search between components, 'kdtree' or 'brute'
+    workers: int if more than 1, the closest pair searches are split across this number of processes. Only the
+             greedy_LCC strategy searches between two whole components, the other ones ignore the workers
+
+    ids: list node ids, in the order of G
+    index: dict node id -> position in the arrays
+    coords: np.array (n, 2) y, x coordinates of the nodes
+    '''
+
+    def __init__(self, G, method=None, workers=None):
+        self.G = G
+        self.method = search if method is None else method
+        nodes = list(G.nodes(data=True))
+        self.ids = [n for n, d in nodes]
+        self.index = {n: k for k, n in enumerate(self.ids)}
+        self.coords = np.array([(d['y'], d['x']) for n, d in nodes], dtype=float)
+        self.parallel = ParallelSearch(self.coords, closest_between, workers) if workers is not None and workers > 1 else None
+
+    def close(self):
+        '''
+        Stop the worker processes, if any.
+        '''
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+
+    def distance(self, i, j):
+        '''
+        Euclidean distance between the nodes in positions i and j.
+        '''
+        return euclidean_dist_vec(float(self.coords[i, 0]), float(self.coords[i, 1]),
+                                  float(self.coords[j, 0]), float(self.coords[j, 1]))
+
+    def closest(self, a, b):
+        '''
+        Closest pair of nodes between the positions a and b, see closest_between.
+        '''
+        if self.parallel is not None:
+            return self.parallel.closest(a, b, self.method)
+        return closest_between(self.coords, a, b, self.method)
+
+    def run(self, strategy, name='', max_delta=None, checkpoint=None, telemetry=False):
+        '''
+        Merge the components of the layer following one strategy.
+        ---
+        strategy: MergeStrategy
+        name: str name of the city, for the progress messages
+        max_delta: float stop once the sum of the new links is over it, sequence_max_delta by default
+        checkpoint: Checkpoint to save the sequence and continue from it
+        telemetry: bool log every iteration and print the progress (see telemetry.Telemetry), off in the benchmarks
+
+        returns: lists delta, nodes_cc, length_cc, i_s, j_s, the first row is the initial state
+        '''
+        max_delta = sequence_max_delta if max_delta is None else max_delta
+        delta, nodes_cc, length_cc, i_s, j_s = [0], [0], [0], [0], [0]
+        tracker = ComponentTracker(self.G, by_position=True)
+        state = checkpoint.load() if checkpoint is not None else None
+        if state is not None:  # Continue the saved sequence, its links are replayed on the tracker
+            delta, nodes_cc, length_cc, i_s, j_s = [state[k] for k in ('delta', 'nodes_cc', 'length_cc', 'i', 'j')]
+            for i, j in checkpoint.links(state):
+                tracker.union(self.index[i], self.index[j], length=0)
+            strategy.set_state(state)
+            if state['done']:
+                return delta, nodes_cc, length_cc, i_s, j_s
+        to_iterate = len(tracker)-1  # We'll iterate over n-1 connected components
+        print('{} {}: merging {} components'.format(name, strategy.name, len(tracker)))
+        log = Telemetry('Connect_Components', name, strategy.name, total=to_iterate) if telemetry else Silent()
+        with log.phase('search'):  # The first candidates, counted in the first iteration
+            strategy.start(self, tracker)
+        for it in range(to_iterate):
+            with log.phase('search'):
+                link = strategy.next_link()
+            if link is None:
+                break
+            i, j, dist = link
+            with log.phase('merge'):
+                if strategy.record == 'top2':  # Nodes and km of the two LCC's before merging them
+                    top = tracker.top(2)
+                    nodes_cc.append(sum(tracker.size[r] for r in top))
+                    length_cc.append(sum(tracker.length[r] for r in top))
+                absorbed = list(tracker.nodes(j)) if strategy.absorbs else None
+                tracker.union(i, j, length=0)
+                strategy.merged(i, j, absorbed)
+                if strategy.record == 'lcc':  # Nodes and km of the LCC after the merge
+                    lcc = tracker.largest()
+                    nodes_cc.append(tracker.size[lcc])
+                    length_cc.append(tracker.length[lcc])
+            i_s.append(self.ids[i])  # Store the sequence of links connected
+            j_s.append(self.ids[j])
+            delta.append(delta[-1]+dist)
+            if checkpoint is not None:
+                with log.phase('io'):
+                    checkpoint.update(delta, nodes_cc, length_cc, i_s, j_s, **strategy.get_state())
+            log.iteration(it, queue=len(tracker), delta=delta[-1])
+            if delta[-1] > max_delta:
+                break
+        log.close(delta=delta[-1])
+        if checkpoint is not None:
+            checkpoint.save(delta, nodes_cc, length_cc, i_s, j_s, done=True, **strategy.get_state())
+        return delta, nodes_cc, length_cc, i_s, j_s
+
+
+def main(name, algorithms=None, resume=False, workers=None):
+    '''
+    Load the bike layer of one city once and compute the sequence of every algorithm.
+    ---
+    name: str name of the city
+    algorithms: list names of the strategies, all of them by default
+    resume: bool continue every algorithm from its last checkpoint
+    workers: int number of processes for the closest pair searches of this city, only used by greedy_LCC
+    '''
+    algorithms = list(strategies) if algorithms is None else algorithms
+    print('Starting with {}'.format(name))
+    if workers is not None and workers > 1 and 'greedy_LCC' not in algorithms:
+        print('Only greedy_LCC splits its searches across processes, {} runs with one process'.format(name))
+        workers = None
+    engine = ConnectEngine(load_graph(name, 'bike'), workers=workers)
+    assure_path_exists(output_path)
+    print(' + Data loaded\n + Starting the calculations:')
+    for algorithm in algorithms:
+        strategy = strategies[algorithm]()
+        checkpoint = Checkpoint(output_path+'{}_CC_data_{}.checkpoint.json'.format(name, strategy.suffix), interval=checkpoint_interval)
+        if not resume:
+            checkpoint.remove()  # Start from scratch
+        delta, nodes_cc, length_cc, i_s, j_s = engine.run(strategy, name, checkpoint=checkpoint, telemetry=True)
+        df = pd.DataFrame(np.column_stack([delta, nodes_cc, length_cc, i_s, j_s]), columns=[
+                          'delta', 'nodes_cc', 'length_cc', 'i', 'j'])
+        df.to_csv(output_path+'{}_CC_data_{}.csv'.format(name, strategy.suffix))
+        checkpoint.remove()  # The results are safe in the CSV
+        print('{} {} done\n------------\n------------\n\n'.format(name, algorithm))
+    engine.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Connect the components of the bike layer of the cities with every strategy.')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue every city from its last checkpoint instead of starting from scratch')
+    parser.add_argument('--algorithms', nargs='+', choices=sorted(strategies), default=None,
+                        help='strategies to run, all of them by default')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='run the large cities after the rest, one at a time, with this number of processes each '
+                             'for the closest pair searches of greedy_LCC (the other strategies use one process)')
+    args = parser.parse_args()
+    Global_start = time.time()
+    cities = {'Phoenix': 'Phoenix, Arizona, USA',
+              'Detroit': 'Detroit, Michigan, USA',
+              'Manhattan': 'Manhattan, New York City, New York, USA',
+              'Amsterdam': 'Amsterdam, Netherlands',
+              'Mexico': 'DF, Mexico',
+              'London': 'London, England',
+              'Singapore': 'Singapore, Singapore',
+              'Budapest': 'Budapest, Hungary',
+              'Copenhagen': 'Copenhagen Municipality, Denmark',
+              'Barcelona': 'Barcelona, Catalunya, Spain',
+              'Portland': 'Portland, Oregon, USA',
+              'Bogota': 'Bogotá, Colombia',
+              'LA': 'Los Angeles, Los Angeles County, California, USA',
+              'Jakarta': 'Daerah Khusus Ibukota Jakarta, Indonesia'}
+    print('Starting the script, go and grab a coffe, it is going to be a long one :)')
+    later = [c for c in cities if c in large_cities] if args.workers is not None else []
+    pool = Pool(processes=10)
+    pool.map(partial(main, algorithms=args.algorithms, resume=args.resume), [c for c in cities if c not in later])
+    pool.close()
+    for name in later:  # All the cores for one city at a time
+        main(name, algorithms=args.algorithms, resume=args.resume, workers=args.workers)
+    print('All cities done in {} min'.format((time.time()-Global_start)/60))
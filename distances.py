@@ -0,0 +1,104 @@
+'''
+Batched euclidean distance kernels over coordinate arrays.
+Distances are computed in blocks so the memory used never goes over a ceiling, whatever the size of the city.
+Coordinates are np.arrays with shape (n, 2) in (y, x) order, as used by the rest of the scripts.
+'''
+import numpy as np
+
+max_block_bytes = 64 * 2**20  # Default memory ceiling for one block of distances
+_bytes_per_pair = 3 * 8  # dx, dy and the distance, float64
+
+
+def _blocks(n_rows, n_cols, max_bytes):
+    # Split an (n_rows, n_cols) matrix into blocks of at most max_bytes
+    cols = int(max(1, min(n_cols, max_bytes // _bytes_per_pair)))
+    rows = int(max(1, min(n_rows, max_bytes // (_bytes_per_pair * cols))))
+    for r in range(0, n_rows, rows):
+        for c in range(0, n_cols, cols):
+            yield slice(r, r+rows), slice(c, c+cols)
+
+
+def _block(a, b):
+    # Same operations as euclidean_dist_vec, broadcast over the two arrays
+    return ((a[:, None, 1] - b[None, :, 1]) ** 2 + (a[:, None, 0] - b[None, :, 0]) ** 2) ** 0.5
+
+
+def paired_distances(a, b):
+    '''
+    Distance between the points a[k] and b[k].
+    ---
+    a, b: np.array with shape (n, 2)
+
+    returns: np.array with n distances
+    '''
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    return ((a[:, 1] - b[:, 1]) ** 2 + (a[:, 0] - b[:, 0]) ** 2) ** 0.5
+
+
+def min_distances(a, b, max_bytes=None):
+    '''
+    Closest point of b for every point of a.
+    ---
+    a: np.array with shape (n, 2)
+    b: np.array with shape (m, 2)
+    max_bytes: int memory ceiling for one block, max_block_bytes by default
+
+    returns: np.array with n distances and np.array with the positions in b (first one on ties, -1 if b is empty)
+    '''
+    max_bytes = max_block_bytes if max_bytes is None else max_bytes
+    a = np.asarray(a, dtype=float).reshape(-1, 2)
+    b = np.asarray(b, dtype=float).reshape(-1, 2)
+    dist = np.full(len(a), np.inf)
+    arg = np.full(len(a), -1, dtype=int)
+    for rows, cols in _blocks(len(a), len(b), max_bytes):
+        d = _block(a[rows], b[cols])
+        k = d.argmin(axis=1)
+        d_k = d[np.arange(len(k)), k]
+        better = d_k < dist[rows]  # Strictly smaller keeps the first position on ties
+        dist[rows][better] = d_k[better]
+        arg[rows][better] = k[better] + cols.start
+    return dist, arg
+
+
+def closest_pair(a, b, max_bytes=None):
+    '''
+    Closest pair of points between a and b.
+    Ties are resolved in the order of a nested loop over a and then b.
+    ---
+    a: np.array with shape (n, 2)
+    b: np.array with shape (m, 2)
+    max_bytes: int memory ceiling for one block, max_block_bytes by default
+
+    returns: tuple position in a, position in b and distance, None if a or b are empty
+    '''
+    dist, arg = min_distances(a, b, max_bytes)
+    if len(dist) == 0 or arg.max() < 0:
+        return None
+    k = int(dist.argmin())
+    return k, int(arg[k]), float(dist[k])
+
+
+def node_coords(G, nodes):
+    '''
+    Coordinates of some nodes of a graph.
+    ---
+    G: nx.Graph with 'x' and 'y' node attributes
+    nodes: list node ids
+
+    returns: np.array with shape (n, 2), y, x
+    '''
+    return np.array([(G.nodes[n]['y'], G.nodes[n]['x']) for n in nodes], dtype=float).reshape(-1, 2)
+
+
+def seed_distances(G, pairs):
+    '''
+    Euclidean distance between the origin and the destination of every pair of nodes.
+    ---
+    G: nx.Graph with 'x' and 'y' node attributes
+    pairs: list of (origin, destination) node ids
+
+    returns: np.array with one distance per pair
+    '''
+    pairs = list(pairs)
+    return paired_distances(node_coords(G, [p[0] for p in pairs]), node_coords(G, [p[1] for p in pairs]))
@@ -0,0 +1,41 @@
+'''
+Precision of the averages over the seed pairs (d_ij_b and d_ij_s of the Directness scripts).
+The standard error of a mean of n values is their standard deviation / sqrt(n), the confidence interval of the
+mean is mean +- z * standard error, with z from the normal distribution (the samples are hundreds of pairs).
+'''
+import numpy as np
+from scipy.stats import norm
+
+confidence = 0.95  # Level of the confidence intervals
+batch_pairs = 200  # Seed pairs drawn in every batch of the adaptive sampling
+max_pairs = 100000  # Stop the adaptive sampling here even if the intervals are still wider than the tolerance
+
+
+def mean_error(values):
+    '''
+    Mean of some values and its standard error.
+    ---
+    values: list or np.array
+
+    returns: float mean, float standard error (nan with less than two values) and int number of values
+    '''
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n == 0:
+        return np.nan, np.nan, 0
+    error = values.std(ddof=1) / n ** 0.5 if n > 1 else np.nan
+    return float(values.mean()), float(error), n
+
+
+def half_width(values, level=None):
+    '''
+    Half width of the confidence interval of the mean of some values, inf with less than two values.
+    ---
+    values: list or np.array
+    level: float confidence level, confidence by default
+    '''
+    level = confidence if level is None else level
+    error = mean_error(values)[1]
+    if np.isnan(error):
+        return np.inf
+    return float(norm.ppf(0.5 + level / 2) * error)
@@ -0,0 +1,263 @@
+'''
+Contraction hierarchy of a layer that doesn't change, i.e. the drive layer of the street baseline.
+The nodes are contracted one by one, from the least to the most important, adding shortcut links that keep the
+distances between the nodes left. A distance is then the meeting of two small searches that only go up in the
+order of the nodes, one from the origin and one backwards from the destination.
+The hierarchy is built once, saved next to the graph file and loaded by the next runs.
+'''
+import heapq
+import os
+import numpy as np
+from routing import CSRGraph
+from seeds import file_hash
+
+witness_settled = 60  # Nodes settled by the local searches looking for a path that makes a shortcut unnecessary
+hierarchy_version = 1  # Change it when the contraction or the file format changes, old files are then built again
+
+
+def _witness(out_adj, u, v, targets, limit):
+    # Distances from u avoiding v, a bounded local search: the shortcuts of unsettled targets are kept
+    dist = {u: 0.0}
+    heap = [(0.0, u)]
+    done = set()
+    pending = len(targets)
+    while heap and len(done) < witness_settled:
+        d, x = heapq.heappop(heap)
+        if x in done:
+            continue
+        if d > limit:
+            break
+        done.add(x)
+        if x in targets:
+            pending -= 1
+            if not pending:
+                break
+        for y, length in out_adj[x].items():
+            if y == v:
+                continue
+            d_y = d + length
+            if d_y < dist.get(y, np.inf):
+                dist[y] = d_y
+                heapq.heappush(heap, (d_y, y))
+    return dist
+
+
+def _shortcuts(out_adj, in_adj, v):
+    # Links (u, w, length) to add to keep the distances between the neighbours of v once it is contracted
+    found = []
+    if not out_adj[v]:
+        return found
+    for u, l_uv in in_adj[v].items():
+        targets = {w: l_uv + l_vw for w, l_vw in out_adj[v].items() if w != u}
+        if not targets:
+            continue
+        dist = _witness(out_adj, u, v, targets, max(targets.values()))
+        found.extend((u, w, length) for w, length in targets.items() if dist.get(w, np.inf) > length)
+    return found
+
+
+def _csr(links):
+    # Lists indptr, indices and lengths of the links of every node
+    indptr = np.cumsum([0] + [len(l) for l in links]).tolist()
+    indices = [w for l in links for w, length in l]
+    lengths = [length for l in links for w, length in l]
+    return indptr, indices, lengths
+
+
+class ContractionHierarchy(object):
+    '''
+    Contraction hierarchy of a layer, answers distance queries without searching the whole layer.
+    Use build to contract a layer and load_hierarchy to keep it next to the graph file.
+    ---
+    ids: list node ids
+    rank: np.array position of every node in the contraction order
+    up: lists indptr, indices and lengths of the links to more important nodes (forward search)
+    down: lists indptr, indices and lengths of the links from more important nodes (backward search)
+    directed: bool the layer was directed
+    source: str hash of the graph file the hierarchy was built from, '' if unknown
+
+    settled: int nodes settled by all the queries so far, to compare with the other searches
+    '''
+
+    def __init__(self, ids, rank, up, down, directed, source=''):
+        self.ids = list(ids)
+        self.index = {n: k for k, n in enumerate(self.ids)}
+        self.rank = np.asarray(rank)
+        self.up = tuple(list(a) for a in up)
+        self.down = tuple(list(a) for a in down)
+        self.directed = directed
+        self.source = source
+        self.settled = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, G, source=''):
+        '''
+        Contract a layer. The next node is the one adding the fewest shortcuts for the links it removes
+        (edge difference) plus its neighbours already contracted, to spread the contraction over the layer.
+        ---
+        G: nx.Graph, nx.MultiGraph, their directed versions or a CSRGraph, with the 'length' of the links
+        source: str hash of the graph file, see load_hierarchy
+
+        returns: ContractionHierarchy
+        '''
+        layer = G if isinstance(G, CSRGraph) else CSRGraph(G)
+        csr = layer.csr
+        n = len(layer)
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        rows = np.repeat(np.arange(n), np.diff(csr.indptr))
+        for u, v, length in zip(rows.tolist(), csr.indices.tolist(), csr.data.tolist()):
+            if u != v:  # Loops never shorten a distance
+                out_adj[u][v] = length
+                in_adj[v][u] = length
+
+        def priority(v, found):
+            return len(found) - len(out_adj[v]) - len(in_adj[v]) + contracted_neighbours[v]
+
+        contracted_neighbours = [0] * n
+        heap = [(priority(v, _shortcuts(out_adj, in_adj, v)), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.zeros(n, dtype=np.int64)
+        up, down = [None] * n, [None] * n
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            found = _shortcuts(out_adj, in_adj, v)
+            p = priority(v, found)
+            if heap and p > heap[0][0]:  # Lazy update, the priority grew since it was pushed
+                heapq.heappush(heap, (p, v))
+                continue
+            up[v] = list(out_adj[v].items())
+            down[v] = list(in_adj[v].items())
+            for w in out_adj[v]:
+                del in_adj[w][v]
+                contracted_neighbours[w] += 1
+            for u in in_adj[v]:
+                del out_adj[u][v]
+                contracted_neighbours[u] += 1
+            out_adj[v], in_adj[v] = {}, {}
+            for u, w, length in found:
+                if length < out_adj[u].get(w, np.inf):
+                    out_adj[u][w] = length
+                    in_adj[w][u] = length
+            rank[v] = order
+            order += 1
+        return cls(layer.ids, rank, _csr(up), _csr(down), layer.directed, source)
+
+    def save(self, path):
+        '''
+        Save the hierarchy to a .npz file, written aside and moved so a crash never leaves half a file.
+        '''
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, ids=np.array(self.ids), rank=self.rank,
+                     up_indptr=np.array(self.up[0], dtype=np.int64), up_indices=np.array(self.up[1], dtype=np.int64),
+                     up_lengths=np.array(self.up[2], dtype=float),
+                     down_indptr=np.array(self.down[0], dtype=np.int64), down_indices=np.array(self.down[1], dtype=np.int64),
+                     down_lengths=np.array(self.down[2], dtype=float),
+                     directed=self.directed, source=self.source, version=hierarchy_version)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Load a hierarchy saved with save, None if it was saved by another version.
+        '''
+        with np.load(path) as f:
+            if int(f['version']) != hierarchy_version:
+                return None
+            return cls(f['ids'].tolist(), f['rank'],
+                       (f['up_indptr'].tolist(), f['up_indices'].tolist(), f['up_lengths'].tolist()),
+                       (f['down_indptr'].tolist(), f['down_indices'].tolist(), f['down_lengths'].tolist()),
+                       bool(f['directed']), str(f['source']))
+
+    def _search(self, start, links):
+        # Distance to every node of the upward search space of start
+        indptr, indices, lengths = links
+        done = {}
+        heap = [(0.0, start)]
+        while heap:
+            d, x = heapq.heappop(heap)
+            if x in done:
+                continue
+            done[x] = d
+            for k in range(indptr[x], indptr[x+1]):
+                y = indices[k]
+                if y not in done:
+                    heapq.heappush(heap, (d + lengths[k], y))
+        self.settled += len(done)
+        return done
+
+    @staticmethod
+    def _meet(forward, backward):
+        # Shortest distance through a node reached by both searches
+        if len(backward) < len(forward):
+            forward, backward = backward, forward
+        return min((d + backward[x] for x, d in forward.items() if x in backward), default=np.inf)
+
+    def distance(self, source, target):
+        '''
+        Distance between two nodes, inf if there is no path.
+        '''
+        return self._meet(self._search(self.index[source], self.up), self._search(self.index[target], self.down))
+
+    def distances_from(self, source, targets):
+        '''
+        Distance from one node to many (one to many), the search from the source is done once.
+        ---
+        source: node id
+        targets: list node ids
+
+        returns: np.array distance to every target, inf if there is no path
+        '''
+        forward = self._search(self.index[source], self.up)
+        return np.array([self._meet(forward, self._search(self.index[t], self.down)) for t in targets], dtype=float)
+
+    def pair_distances(self, pairs):
+        '''
+        Distance of many pairs of nodes, same result as routing.pair_distances.
+        ---
+        pairs: list of (origin, destination) node ids
+
+        returns: np.array distance of every pair, inf if there is no path
+        '''
+        pairs = list(pairs)
+        by_origin = {}
+        for k, (s, t) in enumerate(pairs):
+            by_origin.setdefault(s, []).append(k)
+        distances = np.full(len(pairs), np.inf)
+        for s, ks in by_origin.items():
+            distances[ks] = self.distances_from(s, [pairs[k][1] for k in ks])
+        return distances
+
+
+def hierarchy_path(graph_path):
+    '''
+    File of the hierarchy of a graph file, next to it: {city}_drive.graphml -> {city}_drive_ch.npz
+    '''
+    return os.path.splitext(graph_path)[0] + '_ch.npz'
+
+
+def load_hierarchy(G, graph_path):
+    '''
+    Contraction hierarchy of a layer read from a graph file. It is loaded from next to the file if it was
+    already built from the same content and directedness, otherwise it is built and saved there.
+    ---
+    G: nx.Graph or CSRGraph layer loaded from graph_path
+    graph_path: str path of the graph file
+
+    returns: ContractionHierarchy
+    '''
+    path = hierarchy_path(graph_path)
+    source = file_hash(graph_path)
+    directed = G.directed if isinstance(G, CSRGraph) else G.is_directed()
+    if os.path.exists(path):
+        hierarchy = ContractionHierarchy.load(path)
+        if hierarchy is not None and hierarchy.source == source and hierarchy.directed == directed:
+            return hierarchy
+    hierarchy = ContractionHierarchy.build(G, source)
+    hierarchy.save(path)
+    return hierarchy
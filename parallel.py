@@ -0,0 +1,115 @@
+'''
+Split the work of one city across worker processes.
+ParallelSearch splits the closest pair search: the node coordinates are copied once into shared memory, every
+call only sends the positions of the two groups of nodes. Each worker searches a chunk of the first group and
+the candidates are reduced by (distance, order in the first group, order in the second group), so the result is
+the same as the serial search whatever the number of workers.
+fork_map runs independent tasks (i.e. the algorithms of a city) over objects the workers inherit by fork.
+'''
+from multiprocessing import Pool, RawArray
+import multiprocessing
+import numpy as np
+import gc
+import os
+
+_coords = None
+_forked = None
+
+
+def _init_worker(shared, shape):
+    # Attach the worker to the shared coordinates, no copy
+    global _coords
+    _coords = np.frombuffer(shared, dtype=np.float64).reshape(shape)
+
+
+def _search_chunk(args):
+    search, a, offset, b, method = args
+    found = search(_coords, a, b, method)
+    if found is None:
+        return None
+    i, j, d = found
+    return d, offset + int(np.flatnonzero(a == i)[0]), int(np.flatnonzero(b == j)[0])
+
+
+class ParallelSearch(object):
+    '''
+    Pool of workers sharing the coordinates of the nodes of one city.
+    ---
+    coords: np.array (n, 2) coordinates of the nodes
+    search: function search(coords, a, b, method) -> (i, j, dist) or None, i.e. connect_engine.closest_between
+    processes: int number of workers, all the cores by default
+    min_nodes: int smaller searches (len(a) + len(b)) run in the main process
+    '''
+
+    def __init__(self, coords, search, processes=None, min_nodes=20000):
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        self.shared = RawArray('d', coords.size)
+        np.frombuffer(self.shared, dtype=np.float64)[:] = coords.ravel()
+        self.coords = np.frombuffer(self.shared, dtype=np.float64).reshape(coords.shape)
+        self.search = search
+        self.min_nodes = min_nodes
+        self.processes = os.cpu_count() if processes is None else processes
+        self.pool = Pool(processes=self.processes, initializer=_init_worker, initargs=(self.shared, coords.shape))
+
+    def closest(self, a, b, method='kdtree'):
+        '''
+        Closest pair of nodes between the positions a and b.
+
+        returns: tuple position in a, position in b and distance, None if a group is empty
+        '''
+        a = np.asarray(a, dtype=int)
+        b = np.asarray(b, dtype=int)
+        if len(a) == 0 or len(b) == 0:
+            return None
+        if len(a) + len(b) < self.min_nodes or len(a) < 2:
+            return self.search(self.coords, a, b, method)
+        chunks = np.array_split(a, min(len(a), self.processes))
+        offsets = np.cumsum([0] + [len(c) for c in chunks[:-1]])
+        found = self.pool.map(_search_chunk, [(self.search, c, int(o), b, method) for c, o in zip(chunks, offsets)])
+        d, k_a, k_b = min(f for f in found if f is not None)
+        return a[k_a], b[k_b], d
+
+    def close(self):
+        '''
+        Stop the workers.
+        '''
+        self.pool.close()
+        self.pool.join()
+
+
+def _run_forked(task):
+    function, args = _forked
+    return function(task, *args)
+
+
+def fork_map(function, tasks, args=(), processes=None):
+    '''
+    Call function(task, *args) for every task in forked worker processes.
+    The args are not pickled, the workers inherit them from the parent by fork and share their memory pages
+    until they write to them (copy on write). The garbage collector is frozen before forking so it doesn't
+    write to the pages of the shared objects. Without fork (i.e. Windows) the tasks run one after another.
+    It can't be called from a worker of a multiprocessing.Pool, those can't have children.
+    ---
+    function: function(task, *args), only the tasks and the results are pickled
+    tasks: list
+    args: tuple of objects shared by all the calls
+    processes: int number of workers, one per task by default
+
+    returns: list with the result of every task
+    '''
+    global _forked
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return [function(task, *args) for task in tasks]
+    _forked = (function, args)
+    if hasattr(gc, 'freeze'):  # Python 3.7+
+        gc.freeze()
+    try:
+        pool = multiprocessing.get_context('fork').Pool(processes=len(tasks) if processes is None else processes)
+        results = pool.map(_run_forked, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    finally:
+        _forked = None
+        if hasattr(gc, 'unfreeze'):
+            gc.unfreeze()
+    return results
@@ -0,0 +1,92 @@
+'''
+Append-only CSV files for the results of the long loops over a merge sequence (directness, coverage).
+Every finished row is written and flushed at once, so a run that stops loses at most the row in progress and
+the next run continues from the first missing row. The files are plain CSV readable with
+pd.read_csv(path, index_col=0).
+'''
+import csv
+import io
+import os
+import pandas as pd
+
+
+class ResultWriter(object):
+    '''
+    Results of one loop, one row per finished iteration.
+    A half written last line (the run stopped while writing it) is dropped when the file is opened.
+    ---
+    path: str path of the csv file
+    columns: list names of the columns, the first one is the index of the rows ('' as pandas writes it)
+
+    rows: int number of finished rows in the file, the position of the first row to compute
+    '''
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = [str(c) for c in columns]
+        self.rows = self._finished()
+        self._file = None
+        self._writer = None
+
+    def _finished(self):
+        # Finished rows already in the file. Its header is checked before cutting anything, a file written in
+        # another format (i.e. the lines ending with the letter n of the original scripts) is never truncated
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        if b'\n' not in content:
+            line = io.StringIO()
+            csv.writer(line).writerow(self.columns)
+            if not line.getvalue().encode().startswith(content):
+                raise ValueError('{} has no finished line and is not a header of the columns {}. Move it away to start again'.format(self.path, self.columns))
+            end = 0  # Empty, or the run stopped while writing the header
+        else:
+            header = next(csv.reader([content[:content.find(b'\n')].decode()]))
+            if header != self.columns:
+                raise ValueError('{} has the columns {}, not {}. Move it away to start again'.format(self.path, header, self.columns))
+            end = content.rfind(b'\n') + 1
+        if end < len(content):
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+        return max(len(content[:end].decode().splitlines()) - 1, 0)
+
+    def write(self, values):
+        '''
+        Append one row and flush it to disk.
+        ---
+        values: list with one value per column
+        '''
+        if len(values) != len(self.columns):
+            raise ValueError('{} values for {} columns'.format(len(values), len(self.columns)))
+        if self._file is None:
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            self._file = open(self.path, 'a', newline='')
+            self._writer = csv.writer(self._file)
+            if self.rows == 0 and self._file.tell() == 0:
+                self._writer.writerow(self.columns)
+        self._writer.writerow(values)
+        self._file.flush()
+        self.rows += 1
+
+    def read(self):
+        '''
+        Finished rows.
+
+        returns: pd.DataFrame indexed by the first column
+        '''
+        self.close()
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=self.columns[1:])
+        return pd.read_csv(self.path, index_col=0)
+
+    def close(self):
+        '''
+        Close the file, the next write opens it again.
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
@@ -0,0 +1,478 @@
+'''
+Travel distances between the seed pairs of the Directness scripts.
+'''
+import copy
+import heapq
+import itertools
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+from distances import paired_distances
+
+max_block_bytes = 256 * 2**20  # Memory ceiling for one block of distances from many sources of a CSRGraph
+landmark_count = 8  # Landmarks of the ALT searches of a CSRGraph
+methods = ('dijkstra', 'astar', 'alt')  # Searches of pair_distances
+
+
+def link_length(G, u, v, links):
+    '''
+    Length of the shortest link between two neighbours, the euclidean distance for links without length.
+    ---
+    links: dict data of the link, or of the parallel links keyed by key in a multigraph (G[u][v])
+    '''
+    lengths = [float(d['length']) for d in (links.values() if G.is_multigraph() else [links]) if 'length' in d]
+    if lengths:
+        return min(lengths)
+    return ((G.nodes[u]['x'] - G.nodes[v]['x']) ** 2 + (G.nodes[u]['y'] - G.nodes[v]['y']) ** 2) ** 0.5
+
+
+class CSRGraph(object):
+    '''
+    Layer compiled into a compressed sparse row adjacency, searched with scipy.sparse.csgraph.
+    Parallel links are reduced to the shortest one and undirected layers get the links in both directions.
+    New links (i.e. the rows of a merge sequence) are buffered and inserted into the adjacency before the next search.
+    ---
+    G: nx.Graph, nx.MultiGraph or their directed versions, with 'x' and 'y' in the nodes and 'length' in the links
+       (links without length count with the euclidean distance of their ends)
+    max_bytes: int memory ceiling for one block of distances from many sources, max_block_bytes by default
+
+    ids: list node ids, in the order of G
+    index: dict node id -> position in the arrays
+    coords: np.array (n, 2) y, x coordinates of the nodes
+    scale: float smallest ratio length / euclidean distance of the links, the share of the euclidean distance used by A*
+    settled: int nodes settled by all the searches so far, to compare the search methods
+    '''
+
+    def __init__(self, G, max_bytes=None):
+        self.directed = G.is_directed()
+        self.max_bytes = max_block_bytes if max_bytes is None else max_bytes
+        nodes = list(G.nodes(data=True))
+        self.ids = [n for n, d in nodes]
+        self.index = {n: k for k, n in enumerate(self.ids)}
+        self.coords = np.array([(d.get('y', np.nan), d.get('x', np.nan)) for n, d in nodes], dtype=float).reshape(-1, 2)
+        links = [(self.index[u], self.index[v], d.get('length', np.nan)) for u, v, d in G.edges(data=True)]
+        rows = np.array([l[0] for l in links], dtype=np.int64)
+        cols = np.array([l[1] for l in links], dtype=np.int64)
+        lengths = np.array([l[2] for l in links], dtype=float)
+        missing = np.isnan(lengths)
+        lengths[missing] = paired_distances(self.coords[rows[missing]], self.coords[cols[missing]])
+        self._pending = []
+        self._lists = None
+        self._alt = None
+        self.settled = 0
+        self.scale = 1.0
+        self._rescale(rows, cols, lengths)
+        self.matrix = self._reduce(*self._both_ways(rows, cols, lengths))
+        self.matrix.sort_indices()  # The new links are inserted in the sorted rows (see _merge)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _both_ways(self, rows, cols, lengths):
+        # Undirected links are stored in both directions
+        if self.directed:
+            return rows, cols, lengths
+        return np.concatenate([rows, cols]), np.concatenate([cols, rows]), np.concatenate([lengths, lengths])
+
+    def _shortest(self, rows, cols, lengths):
+        # Links sorted by origin and destination, only the shortest of the parallel ones
+        order = np.lexsort((lengths, cols, rows))
+        rows, cols, lengths = rows[order], cols[order], lengths[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        return rows[first], cols[first], lengths[first]
+
+    def _reduce(self, rows, cols, lengths):
+        # CSR matrix with the shortest of the parallel links, explicit zeros are links of length 0
+        rows, cols, lengths = self._shortest(rows, cols, lengths)
+        return csr_matrix((lengths, (rows, cols)), shape=(len(self.ids), len(self.ids)))
+
+    def _rescale(self, rows, cols, lengths):
+        # With scale <= length / euclidean of every link, scale * euclidean(v, t) never decreases by more than the
+        # length of a link and the guide of A* is consistent, whatever the distortion of the projection
+        euclidean = paired_distances(self.coords[rows], self.coords[cols])
+        positive = euclidean > 0
+        if positive.any():
+            ratio = float(np.min(np.asarray(lengths, dtype=float)[positive] / euclidean[positive]))
+            self.scale = min(self.scale, ratio * (1 - 1e-12))  # Margin for the rounding of the guide
+
+    def add_edge(self, u, v, length):
+        '''
+        Add a link between two nodes of the layer, same signature as nx.Graph.add_edge(u, v, length=length).
+        '''
+        i, j = self.index[u], self.index[v]
+        self._pending.append((i, j, float(length)))
+        self._rescale([i], [j], [float(length)])
+        self._alt = None  # New links make the landmark distances overestimate
+
+    def overlay(self):
+        '''
+        Copy of the layer sharing the compiled adjacency, to add the links of one run without modifying this one.
+        The links added to the copy are merged into a new matrix, the arrays of this layer are never written.
+        The landmarks of this layer are shared until a link is added to the copy.
+        '''
+        layer = copy.copy(self)
+        layer._pending = list(self._pending)
+        layer._lists = None
+        return layer
+
+    def _merge(self, rows, cols, lengths):
+        # Insert new links into the sorted rows of the matrix, the shortest one where there is already a link.
+        # Only copies of the arrays, O(E), instead of sorting all the links again, and the arrays of the current
+        # matrix are never written (they may be shared with an overlay)
+        n = len(self.ids)
+        rows, cols, lengths = self._shortest(rows, cols, lengths)
+        m = self.matrix
+        indptr, indices = m.indptr, m.indices
+        pos = np.array([indptr[r] + np.searchsorted(indices[indptr[r]:indptr[r+1]], c)
+                        for r, c in zip(rows.tolist(), cols.tolist())], dtype=np.int64)
+        exists = pos < indptr[rows + 1]
+        exists[exists] = indices[pos[exists]] == cols[exists]
+        data = m.data.copy()
+        data[pos[exists]] = np.minimum(data[pos[exists]], lengths[exists])
+        add = ~exists
+        indices = np.insert(indices, pos[add], cols[add])
+        data = np.insert(data, pos[add], lengths[add])
+        indptr = indptr + np.concatenate([[0], np.cumsum(np.bincount(rows[add], minlength=n))])
+        return csr_matrix((data, indices, indptr), shape=(n, n))
+
+    @property
+    def csr(self):
+        '''
+        scipy.sparse.csr_matrix with the length of the links, including the new ones.
+        '''
+        if self._pending:
+            new = np.array(self._pending, dtype=float).reshape(-1, 3)
+            self.matrix = self._merge(*self._both_ways(new[:, 0].astype(np.int64), new[:, 1].astype(np.int64), new[:, 2]))
+            self._pending = []
+            self._lists = None
+        return self.matrix
+
+    def distances_from(self, source):
+        '''
+        Distance from one node to every node, see distances_from.
+        scipy's Dijkstra can't stop once some targets are settled, the search covers the component of the node.
+
+        returns: np.array distances in the order of ids, inf without a path
+        '''
+        d = dijkstra(self.csr, directed=True, indices=self.index[source])
+        self.settled += int(np.isfinite(d).sum())
+        return d
+
+    def pair_distances(self, pairs, method='dijkstra'):
+        '''
+        Distance of many pairs of nodes, see pair_distances.
+        With dijkstra the sources are searched together in blocks of at most max_bytes of distances,
+        with astar and alt every pair is searched on its own, see astar.
+        '''
+        pairs = list(pairs)
+        distances = np.full(len(pairs), np.inf)
+        if len(pairs) == 0:
+            return distances
+        if method in ('astar', 'alt'):
+            for k, (s, t) in enumerate(pairs):
+                distances[k] = self.astar(s, t, alt=method == 'alt')
+            return distances
+        origins, inverse = np.unique([self.index[s] for s, t in pairs], return_inverse=True)
+        destinations = np.array([self.index[t] for s, t in pairs], dtype=int)
+        block = int(max(1, self.max_bytes // (8 * max(len(self.ids), 1))))
+        for start in range(0, len(origins), block):
+            d = dijkstra(self.csr, directed=True, indices=origins[start:start+block])
+            self.settled += int(np.isfinite(d).sum())
+            ks = np.flatnonzero((inverse >= start) & (inverse < start + block))
+            distances[ks] = d[inverse[ks] - start, destinations[ks]]
+        return distances
+
+    def landmarks(self, count=None):
+        '''
+        Pick landmarks and store their distances to and from every node, the tables of the ALT searches.
+        The landmarks are spread over the largest component by farthest point selection: every new one is the
+        node farthest from the ones already picked. Nodes in other components are searched with the
+        euclidean guide only. The tables are dropped when a link is added to the layer.
+        ---
+        count: int number of landmarks, landmark_count by default
+
+        returns: list ids of the landmarks
+        '''
+        count = landmark_count if count is None else count
+        csr = self.csr
+        _, labels = self.components()
+        nodes = np.flatnonzero(labels == np.bincount(labels).argmax())
+        picked = []
+        closest = np.full(len(self.ids), np.inf)
+        d = dijkstra(csr, directed=False, indices=nodes[0])  # The first landmark is the farthest from any node
+        for _ in range(min(count, len(nodes))):
+            reached = np.where(np.isfinite(d), d, -1.0)
+            picked.append(int(np.argmax(reached)))
+            d = dijkstra(csr, directed=False, indices=picked[-1])
+            closest = np.minimum(closest, d)
+            d = closest
+        from_landmarks = dijkstra(csr, directed=True, indices=picked).T
+        to_landmarks = dijkstra(csr.T.tocsr(), directed=True, indices=picked).T if self.directed else from_landmarks
+        self._alt = (np.ascontiguousarray(from_landmarks), np.ascontiguousarray(to_landmarks))
+        return [self.ids[k] for k in picked]
+
+    def astar(self, source, target, alt=False):
+        '''
+        Distance between two nodes with A*, guided by the euclidean distance to the target.
+        The coordinates must be in the units of the lengths (projected layer), the guide is scaled by scale,
+        the smallest ratio length / euclidean distance of the links, so it never overestimates whatever the
+        distortion of the projection (i.e. UTM far from its central meridian).
+        With alt the guide is the largest of the euclidean distance and the bounds given by the landmarks
+        by the triangle inequality, d(v, t) >= d(L, t) - d(L, v) and d(v, t) >= d(v, L) - d(t, L).
+        The tables are built by landmarks on the first search, and again after new links are added,
+        so alt pays off on a layer that doesn't change between searches (i.e. the street layer).
+        The nodes settled are added to settled.
+        ---
+        source, target: node ids
+        alt: bool use the landmarks
+
+        returns: float distance, inf if there is no path
+        '''
+        csr = self.csr
+        if self._lists is None:  # Plain lists are faster than arrays item by item
+            self._lists = (csr.indptr.tolist(), csr.indices.tolist(), csr.data.tolist(),
+                           self.coords[:, 0].tolist(), self.coords[:, 1].tolist())
+        if alt and self._alt is None:
+            self.landmarks()
+        indptr, indices, lengths, ys, xs = self._lists
+        s, t = self.index[source], self.index[target]
+        y_t, x_t = ys[t], xs[t]
+        scale = self.scale
+        if alt:
+            from_landmarks, to_landmarks = self._alt
+            from_t, to_t = from_landmarks[t], to_landmarks[t]
+
+        def guide(v):
+            h = scale * ((xs[v] - x_t) ** 2 + (ys[v] - y_t) ** 2) ** 0.5
+            if alt:
+                with np.errstate(invalid='ignore'):  # inf - inf, landmarks reaching neither node tell nothing
+                    bound = np.fmax.reduce(np.concatenate([from_t - from_landmarks[v], to_landmarks[v] - to_t]))
+                if bound > h:
+                    h = float(bound)
+            return h
+
+        settled = set()
+        best = {s: 0.0}
+        heap = [(guide(s), 0.0, s)] if guide(s) < np.inf else []
+        d_t = np.inf
+        while heap:
+            f, d, u = heapq.heappop(heap)
+            if u == t:
+                d_t = d
+                break
+            if u in settled:
+                continue
+            settled.add(u)
+            for k in range(indptr[u], indptr[u+1]):
+                v = indices[k]
+                d_v = d + lengths[k]
+                if v not in settled and d_v < best.get(v, np.inf):
+                    h = guide(v)
+                    if h == np.inf:  # The landmarks show that v doesn't reach the target
+                        continue
+                    best[v] = d_v
+                    heapq.heappush(heap, (d_v + h, d_v, v))
+        self.settled += len(settled)
+        return d_t
+
+    def components(self):
+        '''
+        Weakly connected components of the layer.
+
+        returns: int number of components and np.array with the component of every node, in the order of ids
+        '''
+        return connected_components(self.csr, directed=True, connection='weak')
+
+
+def distances_from(G, source, targets=None):
+    '''
+    Single source Dijkstra over the length of the links, without building the paths.
+    ---
+    G: nx.Graph, nx.MultiGraph, their directed versions or a CSRGraph
+    source: node id
+    targets: list node ids, the search stops as soon as all of them are settled (not in a CSRGraph, its search
+             covers the component of the source), all the graph by default
+
+    returns: dict node -> distance of the settled nodes, targets without a path are missing
+    '''
+    if isinstance(G, CSRGraph):
+        d = G.distances_from(source)
+        targets = G.ids if targets is None else targets
+        return {t: d[G.index[t]] for t in targets if d[G.index[t]] < np.inf}
+    pending = set(targets) if targets is not None else None
+    settled = {}
+    best = {source: 0.0}
+    order = itertools.count()  # Breaks ties without comparing node ids
+    heap = [(0.0, next(order), source)]
+    while heap:
+        d, _, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        settled[u] = d
+        if pending is not None:
+            pending.discard(u)
+            if not pending:
+                break
+        for v, links in G.adj[u].items():
+            if v in settled:
+                continue
+            d_v = d + link_length(G, u, v, links)
+            if d_v < best.get(v, np.inf):
+                best[v] = d_v
+                heapq.heappush(heap, (d_v, next(order), v))
+    return settled
+
+
+def pair_distances(G, pairs, components=None, method='dijkstra'):
+    '''
+    Travel distance of many pairs of nodes, with one bounded Dijkstra per origin.
+    ---
+    G: nx.Graph, nx.MultiGraph, their directed versions or a CSRGraph
+    pairs: list of (origin, destination) node ids
+    components: ComponentTracker of G, only the pairs inside the same component are searched
+    method: str 'dijkstra', or 'astar' and 'alt' for one A* search per pair (CSRGraph only, see CSRGraph.astar)
+
+    returns: np.array distance of every pair, inf if there is no path
+    '''
+    pairs = list(pairs)
+    if method not in methods:
+        raise ValueError('Unknown search method {}, use one of {}'.format(method, methods))
+    if method != 'dijkstra' and not isinstance(G, CSRGraph):
+        raise ValueError('The {} search needs a CSRGraph'.format(method))
+    if components is not None:
+        connected = np.array([components.connected(s, t) for s, t in pairs], dtype=bool)
+        distances = np.full(len(pairs), np.inf)
+        if connected.any():
+            distances[connected] = pair_distances(G, [pairs[k] for k in np.flatnonzero(connected)], method=method)
+        return distances
+    if isinstance(G, CSRGraph):
+        return G.pair_distances(pairs, method)
+    by_origin = {}
+    for k, (s, t) in enumerate(pairs):
+        by_origin.setdefault(s, []).append(k)
+    distances = np.full(len(pairs), np.inf)
+    for s, ks in by_origin.items():
+        lengths = distances_from(G, s, [pairs[k][1] for k in ks])
+        distances[ks] = [lengths.get(pairs[k][1], np.inf) for k in ks]
+    return distances
+
+
+def add_links(G, links, lengths):
+    '''
+    Add many links at once, i.e. to replay the links of a merge sequence before continuing it.
+    ---
+    G: nx.Graph or CSRGraph, the links of a CSRGraph are merged into its adjacency in one operation
+    links: list of (u, v) node ids
+    lengths: list float length of every link
+    '''
+    if isinstance(G, CSRGraph):
+        for (u, v), length in zip(links, lengths):
+            G.add_edge(u, v, length)  # Buffered until the next search
+    else:
+        G.add_edges_from((u, v, {'length': float(length)}) for (u, v), length in zip(links, lengths))
+
+
+class SeedDistances(object):
+    '''
+    Travel distance of every seed pair of a layer, kept up to date while new links are added to it.
+    A new link (i, j) of length w only shortens the pairs whose new route uses it, so instead of
+    searching every pair again two single source searches from i and j are enough:
+    d(s, t) = min(d(s, t), d(s, i) + w + d(j, t), d(s, j) + w + d(i, t))
+    ---
+    G: nx.Graph, nx.MultiGraph or CSRGraph undirected layer with the 'length' of the links, new links are added to it
+    pairs: list of (origin, destination) node ids
+    components: ComponentTracker of G, updated by the caller before add_edge, the searches only look for the
+                seed nodes in the component of the new link
+
+    distances: np.array travel distance of every pair, inf if there is no path
+    '''
+
+    def __init__(self, G, pairs, components=None):
+        self.G = G
+        self.components = components
+        self.pairs = list(pairs)
+        self.nodes = list(set(n for pair in self.pairs for n in pair))
+        position = {n: k for k, n in enumerate(self.nodes)}
+        self.origins = np.array([position[s] for s, t in self.pairs], dtype=int)
+        self.destinations = np.array([position[t] for s, t in self.pairs], dtype=int)
+        self.distances = pair_distances(G, self.pairs, components)
+
+    def _from(self, source):
+        # Distance from source to every seed node, inf for the nodes it doesn't reach
+        targets = self.nodes
+        if self.components is not None:
+            targets = [n for n in targets if self.components.connected(source, n)]
+        lengths = distances_from(self.G, source, targets)
+        return np.array([lengths.get(n, np.inf) for n in self.nodes])
+
+    def add_edge(self, i, j, length):
+        '''
+        Add a link to the layer and update the distances of the pairs.
+        ---
+        i, j: node ids
+        length: float length of the link
+
+        returns: np.array distances of the pairs
+        '''
+        self.G.add_edge(i, j, length=length)
+        from_i = self._from(i)
+        from_j = self._from(j)
+        through_ij = from_i[self.origins] + length + from_j[self.destinations]
+        through_ji = from_j[self.origins] + length + from_i[self.destinations]
+        self.distances = np.minimum(self.distances, np.minimum(through_ij, through_ji))
+        return self.distances
+
+
+class DistanceMatrix(object):
+    '''
+    Travel distance between every pair of nodes of a small layer, kept up to date while new links are added to it.
+    The matrix is computed at once by scipy's Dijkstra from all the nodes, a new link (i, j) of length w only
+    shortens the routes through it, d(a, b) = min(d(a, b), d(a, i) + w + d(j, b)) (and through (j, i) in an
+    undirected layer), updated with numpy in blocks of rows for the nodes reaching i and the nodes reached from j.
+    It takes n * n * 8 bytes, use it for layers of a few thousand nodes.
+    ---
+    G: nx.Graph, nx.MultiGraph, their directed versions or a CSRGraph, the new links are not added to it
+    max_bytes: int memory ceiling for the temporary arrays of one block of rows, max_block_bytes by default
+
+    distances: np.array (n, n) travel distances, inf without a path, in the order of ids
+    '''
+
+    def __init__(self, G, max_bytes=None):
+        layer = G if isinstance(G, CSRGraph) else CSRGraph(G)
+        self.max_bytes = max_block_bytes if max_bytes is None else max_bytes
+        self.ids = layer.ids
+        self.index = layer.index
+        self.directed = layer.directed
+        self.distances = dijkstra(layer.csr, directed=True)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_edge(self, u, v, length):
+        '''
+        Add a link between two nodes and update the distances, same signature as CSRGraph.add_edge.
+        '''
+        i, j = self.index[u], self.index[v]
+        links = [(i, j)] if self.directed else [(i, j), (j, i)]
+        D = self.distances
+        ends = [(D[:, a].copy(), D[b].copy()) for a, b in links]  # To a and from b, before the update
+        for to_a, from_b in ends:
+            # Only the nodes reaching a and the nodes reached from b change, a few in a fragmented layer
+            rows = np.flatnonzero(to_a < np.inf)
+            cols = np.flatnonzero(from_b < np.inf)
+            block = int(max(1, self.max_bytes // (8 * max(len(cols), 1))))
+            for start in range(0, len(rows), block):
+                r = np.ix_(rows[start:start+block], cols)
+                D[r] = np.minimum(D[r], to_a[r[0]] + length + from_b[r[1]])
+
+    def pair_distances(self, pairs):
+        '''
+        Distance of many pairs of nodes, see pair_distances.
+        '''
+        pairs = list(pairs)
+        if len(pairs) == 0:
+            return np.full(0, np.inf)
+        origins = np.array([self.index[s] for s, t in pairs], dtype=int)
+        destinations = np.array([self.index[t] for s, t in pairs], dtype=int)
+        return self.distances[origins, destinations]
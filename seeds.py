@@ -0,0 +1,178 @@
+'''
+Random pairs of nodes (seeds) used to compare the travel distances in the bike layer and in the drive layer.
+All the pairs are drawn at once and their ends are snapped to the drive layer with one KD-tree query.
+The pairs and their distances in the drive layer can be cached on disk, keyed by the content of the graph files,
+so every run and every variant of the Directness scripts uses the same pairs without the street phase.
+The number of pairs can also be adaptive: batches are drawn until the averages are precise enough.
+'''
+import hashlib
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+from distances import node_coords
+from routing import pair_distances
+import estimate
+
+max_rounds = 100  # Draws of the missing pairs before giving up on layers where almost every pair is rejected
+cache_version = 1  # Change it when the sampling or the file format changes, old files are then ignored
+
+
+def is_geographic(G):
+    '''
+    Check if the nodes of a graph are in latitude and longitude (unprojected osmnx graph).
+    '''
+    crs = str(G.graph.get('crs', '')).lower()
+    return 'epsg:4326' in crs or 'longlat' in crs
+
+
+def snap_points(coords, geographic=False):
+    '''
+    Points to search the nearest node in a KD-tree.
+    Geographic coordinates are placed on the unit sphere, where the nearest point by chord is the nearest
+    by great circle distance, as ox.get_nearest_node does with the haversine distance.
+    ---
+    coords: np.array (n, 2) y, x coordinates
+    geographic: bool coordinates in latitude and longitude
+
+    returns: np.array (n, 2) or (n, 3)
+    '''
+    if not geographic:
+        return coords
+    lat, lon = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def sample_seeds(G_bike, G_drive, pairs, seed=None):
+    '''
+    Draw random pairs of bike nodes and the nearest drive node of each end.
+    Pairs with the same node at both ends, in the bike or in the drive layer, are drawn again.
+    ---
+    G_bike: nx.Graph bike layer
+    G_drive: nx.Graph drive layer
+    pairs: int number of pairs
+    seed: int seed of the generator, the same seed and layers give the same pairs
+
+    returns: lists seeds_bike and seeds_car with the (origin, destination) node ids of every pair
+    '''
+    rng = np.random.default_rng(seed)
+    bike_ids = np.array(list(G_bike.nodes), dtype=object)
+    drive_ids = np.array(list(G_drive.nodes), dtype=object)
+    if len(bike_ids) < 2 or len(drive_ids) < 2:
+        raise ValueError('Both layers need at least two nodes to draw pairs')
+    geographic = is_geographic(G_drive)
+    tree = cKDTree(snap_points(node_coords(G_drive, drive_ids), geographic))
+    bike_points = snap_points(node_coords(G_bike, bike_ids), geographic)
+    bike, car = [], []
+    missing = pairs
+    for _ in range(max_rounds):
+        if missing <= 0:
+            break
+        ends = rng.integers(0, len(bike_ids), size=(missing, 2))
+        snapped = tree.query(bike_points[ends.ravel()])[1].reshape(-1, 2)
+        keep = (ends[:, 0] != ends[:, 1]) & (snapped[:, 0] != snapped[:, 1])
+        bike.append(ends[keep])
+        car.append(snapped[keep])
+        missing -= int(keep.sum())
+    bike = np.vstack(bike)
+    car = np.vstack(car)
+    seeds_bike = list(zip(bike_ids[bike[:, 0]].tolist(), bike_ids[bike[:, 1]].tolist()))
+    seeds_car = list(zip(drive_ids[car[:, 0]].tolist(), drive_ids[car[:, 1]].tolist()))
+    return seeds_bike, seeds_car
+
+
+def file_hash(path):
+    '''
+    SHA-256 of the content of a file.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(folder, files, pairs, seed):
+    '''
+    File of the cached seeds for some graph files, number of pairs and seed of the generator.
+    '''
+    key = hashlib.sha256()
+    for path in files:
+        key.update(file_hash(path).encode())
+    key.update('{} {} {}'.format(pairs, seed, cache_version).encode())
+    return os.path.join(folder, '{}.npz'.format(key.hexdigest()[:32]))
+
+
+def cached_seeds(G_bike, G_drive, pairs, seed, files, folder=None, street=None):
+    '''
+    Seed pairs and their travel distance in the drive layer, loaded from the cache if they were already computed.
+    ---
+    G_bike: nx.Graph bike layer
+    G_drive: nx.Graph drive layer
+    pairs: int number of pairs
+    seed: int seed of the generator
+    files: list paths of the graph files of the layers, their content is part of the key of the cache
+    folder: str folder of the cache, without it the pairs are always drawn and measured
+    street: function street(G_drive, seeds_car) -> np.array distances, routing.pair_distances by default
+
+    returns: lists seeds_bike and seeds_car of (origin, destination) node ids and np.array with the distance
+             of every seeds_car pair in the drive layer (inf without a path)
+    '''
+    street = pair_distances if street is None else street
+    path = cache_path(folder, files, pairs, seed) if folder is not None else None
+    if path is not None and os.path.exists(path):
+        with np.load(path) as cache:
+            seeds_bike = [tuple(p) for p in cache['bike'].tolist()]
+            seeds_car = [tuple(p) for p in cache['car'].tolist()]
+            return seeds_bike, seeds_car, cache['values_car']
+    seeds_bike, seeds_car = sample_seeds(G_bike, G_drive, pairs, seed)
+    values_car = np.asarray(street(G_drive, seeds_car), dtype=float)
+    if path is not None:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:  # Written aside and moved, a crash never leaves a half written cache
+            np.savez(f, bike=np.array(seeds_bike, dtype=np.int64).reshape(-1, 2),
+                     car=np.array(seeds_car, dtype=np.int64).reshape(-1, 2), values_car=values_car)
+        os.replace(tmp, path)
+    return seeds_bike, seeds_car, values_car
+
+
+def adaptive_seeds(G_bike, G_drive, tolerance, seed, files, measure, folder=None, street=None, batch=None, limit=None, level=None):
+    '''
+    Seed pairs drawn in batches until the confidence intervals of some averages over the pairs are narrower than
+    a tolerance. Batch k is drawn with the seed (seed, k), so every batch is cached on its own (see cached_seeds)
+    and a run with a smaller tolerance reuses the batches of the previous ones.
+    ---
+    G_bike: nx.Graph bike layer
+    G_drive: nx.Graph drive layer
+    tolerance: float largest half width of the confidence intervals, or list with one for every average
+    seed: int seed of the generator
+    files: list paths of the graph files of the layers
+    measure: function measure(seeds_bike, seeds_car, values_car) -> list of np.arrays, the values of the pairs
+             of one batch for every average (i.e. the efficiency in each layer)
+    folder: str folder of the cache, see cached_seeds
+    street: function street(G_drive, seeds_car), see cached_seeds
+    batch: int pairs drawn in every batch, estimate.batch_pairs by default
+    limit: int largest number of pairs, estimate.max_pairs by default
+    level: float confidence level, estimate.confidence by default
+
+    returns: lists seeds_bike and seeds_car and np.array values_car of all the batches, as cached_seeds
+    '''
+    batch = estimate.batch_pairs if batch is None else batch
+    limit = estimate.max_pairs if limit is None else limit
+    seeds_bike, seeds_car, values_car, values = [], [], [], None
+    k = 0
+    while len(seeds_bike) < limit:
+        bike, car, street_values = cached_seeds(G_bike, G_drive, min(batch, limit - len(seeds_bike)), (seed, k), files, folder, street)
+        seeds_bike.extend(bike)
+        seeds_car.extend(car)
+        values_car.append(street_values)
+        measured = measure(bike, car, street_values)
+        values = measured if values is None else [np.concatenate([v, m]) for v, m in zip(values, measured)]
+        widths = [estimate.half_width(v, level) for v in values]
+        print('{} seed pairs, confidence intervals +- {}'.format(len(seeds_bike), [round(w, 4) for w in widths]))
+        limits = tolerance if np.ndim(tolerance) else [tolerance] * len(widths)
+        if all(w <= t for w, t in zip(widths, limits)):
+            break
+        k += 1
+    return seeds_bike, seeds_car, np.concatenate(values_car)
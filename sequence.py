@@ -0,0 +1,84 @@
+'''
+Query the merge sequence of the connect components algorithms for any delta budget.
+The sequence is computed once up to a generous maximum, the state for a smaller budget is found by a binary
+search over the cumulative delta, without running the algorithm again.
+'''
+import io
+import numpy as np
+import pandas as pd
+
+# Budgets (sum of the lengths of the new links, in meters) used by the original runs of every algorithm
+default_budgets = {'greedy_min': 200000, 'greedy_LCC': 200000, 'min_delta': 200000, 'random': 100000}
+# The original scripts ended the lines of their CSV files with the letter n, these files start with this header
+legacy_header = ',delta,nodes_cc,length_cc,i,jn'
+
+
+class MergeSequence(object):
+    '''
+    Sequence of links of one algorithm, as saved in the {city}_CC_data_{suffix}.csv files.
+    ---
+    df: pd.DataFrame with the columns delta, nodes_cc, length_cc, i and j, the first row is the initial state
+    '''
+
+    def __init__(self, df):
+        self.df = df
+        self.delta = df['delta'].values.astype(float)
+
+    @classmethod
+    def from_csv(cls, path):
+        '''
+        Load the sequence saved by connect_engine, or by the original connect components scripts (legacy_header).
+        ---
+        path: str path of the csv file
+        '''
+        with open(path) as f:
+            text = f.read()
+        if '\n' not in text and text.startswith(legacy_header):
+            # Only the numbers of the rows follow the header, every n is the end of a line
+            text = '\n'.join([legacy_header[:-1]] + text[len(legacy_header):].split('n'))
+        return cls(pd.read_csv(io.StringIO(text), index_col=0))
+
+    def position(self, budget):
+        '''
+        Last row whose cumulative delta is within the budget.
+        ---
+        budget: float meters of new links
+
+        returns: int position of the row
+        '''
+        return max(int(np.searchsorted(self.delta, budget, side='right')) - 1, 0)
+
+    def state(self, budget):
+        '''
+        State of the layer once all the links within the budget are added.
+        ---
+        budget: float meters of new links
+
+        returns: dict with the budget, the number of links, the delta used and the nodes_cc and length_cc
+                 recorded by the algorithm for the last link
+        '''
+        k = self.position(budget)
+        row = self.df.iloc[k]
+        return {'budget': budget, 'links': k, 'delta': row['delta'],
+                'nodes_cc': row['nodes_cc'], 'length_cc': row['length_cc']}
+
+    def states(self, budgets):
+        '''
+        State of the layer for a list of budgets.
+        ---
+        budgets: list of floats
+
+        returns: pd.DataFrame with one row per budget, see state
+        '''
+        return pd.DataFrame([self.state(b) for b in budgets])
+
+    def truncate(self, budget):
+        '''
+        Rows the original loop would have produced with this budget: it stopped after the first link over it.
+        ---
+        budget: float meters of new links
+
+        returns: pd.DataFrame
+        '''
+        k = int(np.searchsorted(self.delta, budget, side='right'))
+        return self.df.iloc[:k+1]
@@ -0,0 +1,194 @@
+'''
+Spatial indexes over the node coordinates of a layer, used to find the closest nodes between components.
+'''
+import numpy as np
+from scipy.spatial import cKDTree
+
+tree_ratio = 64  # GridIndex.closest_foreign puts the other points in a KD-tree for groups with at least 1 / tree_ratio of their number
+
+
+class DeletableIndex(object):
+    '''
+    KD-tree over a set of points from which points can be removed.
+    Removed points are only masked, the tree is rebuilt with the remaining points once the
+    masked ones are more than rebuild_ratio of the tree, so removals cost O(log n) amortized.
+    ---
+    coords: np.array with shape (n, 2)
+    rebuild_ratio: float fraction of removed points that triggers a rebuild of the tree
+    '''
+
+    def __init__(self, coords, rebuild_ratio=0.25):
+        self.coords = np.asarray(coords, dtype=float)
+        self.alive = np.ones(len(self.coords), dtype=bool)
+        self.n_alive = len(self.coords)
+        self.rebuild_ratio = rebuild_ratio
+        self._build()
+
+    def _build(self):
+        self.ids = np.flatnonzero(self.alive)
+        self.tree = cKDTree(self.coords[self.ids]) if len(self.ids) > 0 else None
+        self.n_dead = 0
+
+    def __len__(self):
+        return self.n_alive
+
+    def remove(self, idx):
+        '''
+        Remove points from the index.
+        ---
+        idx: list or np.array with the positions of the points
+        '''
+        idx = np.asarray(idx, dtype=int)
+        idx = idx[self.alive[idx]]
+        self.alive[idx] = False
+        self.n_alive -= len(idx)
+        self.n_dead += len(idx)
+        if self.n_dead > self.rebuild_ratio * len(self.ids):
+            self._build()
+
+    def query(self, points):
+        '''
+        Find the closest point still in the index for every query point.
+        ---
+        points: np.array with shape (m, 2)
+
+        returns: np.array distances and np.array positions of the closest points (inf and -1 if the index is empty)
+        '''
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        dist = np.full(len(points), np.inf)
+        idx = np.full(len(points), -1, dtype=int)
+        if self.n_alive == 0 or len(points) == 0:
+            return dist, idx
+        pending = np.arange(len(points))
+        k = 1
+        while len(pending) > 0:
+            k = min(k, len(self.ids))
+            d, pos = self.tree.query(points[pending], k=k)
+            d = d.reshape(len(pending), k)
+            pos = pos.reshape(len(pending), k)
+            alive = self.alive[self.ids[pos]]
+            found = alive.any(axis=1)
+            first = alive.argmax(axis=1)  # Neighbours come sorted by distance
+            rows = np.flatnonzero(found)
+            dist[pending[rows]] = d[rows, first[rows]]
+            idx[pending[rows]] = self.ids[pos[rows, first[rows]]]
+            if k == len(self.ids):
+                break
+            pending = pending[~found]
+            k *= 2
+        return dist, idx
+
+
+class GridIndex(object):
+    '''
+    Uniform grid (cell hash) over a set of points tagged with the label of their component.
+    It answers which is the closest point with a different label by expanding rings of cells around
+    a point, and the labels are updated when two components merge.
+    ---
+    coords: np.array with shape (n, 2)
+    labels: np.array with the component label of every point
+    points_per_cell: float average number of points in a cell
+    '''
+
+    def __init__(self, coords, labels, points_per_cell=2.0):
+        self.coords = np.asarray(coords, dtype=float)
+        self.labels = np.array(labels)
+        n = len(self.coords)
+        low = self.coords.min(axis=0)
+        extent = self.coords.max(axis=0) - low
+        if extent[0] > 0 and extent[1] > 0:
+            self.cell = (extent[0] * extent[1] * points_per_cell / n) ** 0.5
+        else:  # All the points in a line or in the same place
+            self.cell = max(extent.max() * points_per_cell / n, 1e-9)
+        self.origin = low
+        cells = np.floor((self.coords - low) / self.cell).astype(int)
+        self.shape = cells.max(axis=0) + 1
+        cell_id = cells[:, 0] * self.shape[1] + cells[:, 1]
+        self.order = np.argsort(cell_id, kind='stable')
+        ids, starts, counts = np.unique(cell_id[self.order], return_index=True, return_counts=True)
+        self.cells = {c: (s, s + k) for c, s, k in zip(ids.tolist(), starts.tolist(), counts.tolist())}
+        self.point_cell = cells
+
+    def relabel(self, idx, label):
+        '''
+        Give a new label to some points, i.e. after their component merged with another one.
+        ---
+        idx: list or np.array with the positions of the points
+        label: new label
+        '''
+        self.labels[np.asarray(idx, dtype=int)] = label
+
+    def _ring(self, c0, c1, r):
+        # Positions of the points inside the cells at Chebyshev distance r from the cell (c0, c1)
+        if r == 0:
+            keys = [(c0, c1)]
+        else:
+            keys = [(c0 - r, c) for c in range(c1 - r, c1 + r + 1)] + [(c0 + r, c) for c in range(c1 - r, c1 + r + 1)]
+            keys += [(c, c1 - r) for c in range(c0 - r + 1, c0 + r)] + [(c, c1 + r) for c in range(c0 - r + 1, c0 + r)]
+        found = []
+        for a, b in keys:
+            if 0 <= a < self.shape[0] and 0 <= b < self.shape[1]:
+                cell = self.cells.get(a * self.shape[1] + b)
+                if cell is not None:
+                    found.append(self.order[cell[0]:cell[1]])
+        return np.concatenate(found) if found else None
+
+    def nearest_foreign(self, p, bound=np.inf):
+        '''
+        Closest point with a label different from the label of the point p.
+        Ties are resolved by the smallest position.
+        ---
+        p: int position of the query point
+        bound: float only points strictly closer than bound are searched
+
+        returns: distance and position of the closest point, inf and -1 if there is none closer than bound
+        '''
+        c0, c1 = self.point_cell[p]
+        label = self.labels[p]
+        y, x = self.coords[p]
+        best, best_pos = np.inf, -1
+        max_r = int(self.shape.max())
+        for r in range(max_r + 1):
+            reach = (r - 1) * self.cell  # Every point in ring r is at least this far away
+            if reach >= bound or reach > best:
+                break
+            pos = self._ring(c0, c1, r)
+            if pos is None:
+                continue
+            pos = pos[self.labels[pos] != label]
+            if len(pos) == 0:
+                continue
+            d = ((x - self.coords[pos, 1]) ** 2 + (y - self.coords[pos, 0]) ** 2) ** 0.5
+            d_min = d.min()
+            if d_min < best or (d_min == best and pos[d == d_min].min() < best_pos):
+                best, best_pos = d_min, pos[d == d_min].min()
+        if best >= bound:
+            return np.inf, -1
+        return best, best_pos
+
+    def closest_foreign(self, idx):
+        '''
+        Closest pair between a group of points with the same label and the points with other labels.
+        Small groups look from each of their points with nearest_foreign, bounded by the best distance found so far.
+        A large group (i.e. the LCC late in a merge sequence) would expand rings over most of the grid from every
+        point, so once it has 1 / tree_ratio of the number of other points these are put in a KD-tree and
+        queried at once, building the tree costs less than the rings.
+        ---
+        idx: list positions of the points of the group, in the order they are searched (ties keep the first one)
+
+        returns: distance, position in the group and position of the other point, inf, None, None if there is none
+        '''
+        idx = np.asarray(idx, dtype=int)
+        others = np.flatnonzero(self.labels != self.labels[idx[0]])
+        if len(others) == 0:
+            return np.inf, None, None
+        if len(idx) * tree_ratio < len(others):
+            best, i, j = np.inf, None, None
+            for a in idx.tolist():
+                d, b = self.nearest_foreign(a, bound=best)
+                if d < best:
+                    best, i, j = d, a, b
+            return best, i, j
+        d, found = cKDTree(self.coords[others]).query(self.coords[idx])
+        first = int(np.argmin(d))
+        return float(d[first]), int(idx[first]), int(others[found[first]])
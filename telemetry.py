@@ -0,0 +1,246 @@
+'''
+Structured progress of the long loops (merge sequences, directness, coverage).
+Every iteration is one JSON line with the city, the algorithm, the elapsed time, the time of every phase of the
+iteration (i.e. component search, routing, I/O), the work left (queue) and the memory of the process. Each loop
+writes to its own file, so the pool workers never mix their lines, and the console gets one summary line every
+console_interval seconds per loop. The lines are written to disk with the summaries, a run that stops
+loses at most the events of the last console_interval seconds.
+The report adds up the files of a whole run to show where the time goes:
+
+python telemetry.py ../logs/telemetry/
+'''
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import os
+import platform
+import resource
+import time
+import numpy as np
+
+#Script configs:
+log_path = '../logs/telemetry/'  # Folder of the JSON lines files, None to only print the summaries
+console_interval = 30.0  # Seconds between two summary lines of the same loop on the console
+memory_interval = 100  # Iterations between two readings of the resident memory, the other events have rss_mb null
+
+
+def rss_mb():
+    '''
+    Resident memory of this process in MB, the peak where the current one is not available (not Linux).
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux, bytes on macOS
+        return peak / 2**20 if platform.system() == 'Darwin' else peak / 2**10
+
+
+def _to_json(value):
+    # numpy scalars are not serializable by json
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('{} is not JSON serializable'.format(type(value)))
+
+
+class Telemetry(object):
+    '''
+    Events of one loop, i.e. one algorithm of one city.
+    ---
+    script: str name of the script
+    city: str
+    algorithm: str
+    total: int iterations of the loop, for the time to go, None if unknown
+    start: int first iteration of this run (the loop continues a previous run)
+    folder: str folder of the JSON lines file, log_path by default
+    interval: float seconds between two summary lines, console_interval by default
+    '''
+
+    def __init__(self, script, city, algorithm, total=None, start=0, folder=None, interval=None):
+        self.script = script
+        self.city = city
+        self.algorithm = algorithm
+        self.total = total
+        self.first = start
+        self.interval = console_interval if interval is None else interval
+        self.run = '{}-{}'.format(datetime.datetime.now().strftime('%Y%m%dT%H%M%S'), os.getpid())
+        self.start = time.time()
+        self.last_print = self.start
+        self.phases = {}
+        self.totals = {}
+        folder = log_path if folder is None else folder
+        self.file = None
+        # The fields of the loop are the same in all its events, they are encoded once
+        self._head = json.dumps({'run': self.run, 'script': script, 'city': city, 'algorithm': algorithm})[:-1] + ', '
+        if folder is not None:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            self.file = open(os.path.join(folder, '{}_{}_{}.jsonl'.format(script, city, algorithm)), 'a')
+        self._emit('start', iteration=start, total=total)
+
+    def _emit(self, event, **values):
+        if self.file is None:
+            return
+        now = time.time()
+        record = {'event': event, 'time': now, 'elapsed': now - self.start}
+        record.update(values)
+        self.file.write(self._head + json.dumps(record, default=_to_json)[1:] + '\n')
+
+    def phase(self, name):
+        '''
+        Time a phase of the current iteration, with telemetry.phase(name): ...
+        The times of a phase in one iteration add up, the phases are not nested.
+        ---
+        name: str i.e. 'search', 'routing', 'io'
+        '''
+        self._phase = name
+        return self
+
+    def __enter__(self):
+        self._phase_start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.phases[self._phase] = self.phases.get(self._phase, 0.0) + time.perf_counter() - self._phase_start
+
+    def eta(self, iteration):
+        '''
+        Seconds to go at the mean time per iteration of this run, None without total.
+        ---
+        iteration: int last finished iteration
+        '''
+        done = iteration + 1 - self.first
+        if self.total is None or done <= 0:
+            return None
+        return (time.time() - self.start) / done * max(self.total - iteration - 1, 0)
+
+    def iteration(self, iteration, queue=None, **extra):
+        '''
+        Record a finished iteration with the times of its phases and print the summary if it is due.
+        ---
+        iteration: int position of the iteration in the loop
+        queue: int work left, i.e. components to merge or rows to compute
+        extra: other values of the iteration, i.e. the efficiency
+        '''
+        for name, seconds in self.phases.items():
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+        memory = rss_mb() if (iteration - self.first) % memory_interval == 0 else None
+        self._emit('iteration', iteration=iteration, total=self.total, phases=self.phases, queue=queue, rss_mb=memory, **extra)
+        self.phases = {}
+        now = time.time()
+        if now - self.last_print >= self.interval or (self.total is not None and iteration + 1 >= self.total):
+            self.last_print = now
+            if self.file is not None:
+                self.file.flush()
+            self.summary(iteration, queue, **extra)
+
+    def summary(self, iteration, queue=None, **extra):
+        '''
+        Print one line with the progress of the loop.
+        '''
+        eta = self.eta(iteration)
+        done = iteration + 1 - self.first
+        values = ' '.join('{}={}'.format(k, round(v, 3) if isinstance(v, float) else v) for k, v in sorted(extra.items()))
+        print('{} {}: {}/{} done in {} min, {} s per iteration, to go: {} min, queue {}, {} MB {}'.format(
+            self.city, self.algorithm, iteration + 1, self.total if self.total is not None else '?',
+            round((time.time() - self.start) / 60, 2), round((time.time() - self.start) / max(done, 1), 3),
+            round(eta / 60, 2) if eta is not None else '?', queue if queue is not None else '-', round(rss_mb(), 1), values).rstrip())
+
+    def close(self, **extra):
+        '''
+        Record the end of the loop with the total time of every phase.
+        '''
+        self._emit('end', phases=self.totals, rss_mb=rss_mb(), **extra)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Silent(object):
+    '''
+    Telemetry of a loop that records and prints nothing, i.e. in the benchmarks.
+    '''
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        yield  # contextlib.nullcontext is Python 3.7+
+
+    def iteration(self, iteration, queue=None, **extra):
+        pass
+
+    def close(self, **extra):
+        pass
+
+
+def load_events(paths):
+    '''
+    Read the events of some JSON lines files, skipping a half written last line.
+    ---
+    paths: list of files or folders (all their .jsonl files)
+
+    returns: list of dicts
+    '''
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path])
+    events = []
+    for path in files:
+        with open(path) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass
+    return events
+
+
+def report(events):
+    '''
+    Print where the time goes: for every script, city and algorithm the iterations, the wall time (added over
+    its runs), the time per iteration and the share of every phase, then the totals of every phase.
+    ---
+    events: list of dicts, see load_events
+
+    returns: dict (script, city, algorithm) -> dict with the measures
+    '''
+    loops = {}
+    for e in events:
+        if e.get('event') != 'iteration':
+            continue
+        loop = loops.setdefault((e['script'], e['city'], e['algorithm']), {'runs': {}, 'steps': [], 'phases': {}, 'rss_mb': 0.0})
+        loop['runs'][e['run']] = max(loop['runs'].get(e['run'], 0.0), e['elapsed'])
+        for name, seconds in e['phases'].items():
+            loop['phases'][name] = loop['phases'].get(name, 0.0) + seconds
+        loop['steps'].append(e)
+        loop['rss_mb'] = max(loop['rss_mb'], e.get('rss_mb') or 0.0)
+    results = {}
+    phases = {}
+    print('{:<24}{:<14}{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}  {}'.format('script', 'city', 'algorithm', 'its', 'min', 's/it', 'p95 s/it', 'MB', 'phases'))
+    for key in sorted(loops):
+        loop = loops[key]
+        per_run = {}
+        for e in loop['steps']:
+            per_run.setdefault(e['run'], []).append(e['elapsed'])
+        steps = np.concatenate([np.diff([0.0] + sorted(v)) for v in per_run.values()])
+        wall = sum(loop['runs'].values())
+        shares = ' '.join('{} {}%'.format(name, int(round(100 * seconds / max(wall, 1e-9))))
+                          for name, seconds in sorted(loop['phases'].items(), key=lambda p: -p[1]))
+        print('{:<24}{:<14}{:<14}{:>8}{:>10.2f}{:>10.3f}{:>10.3f}{:>10.1f}  {}'.format(
+            key[0][:23], key[1][:13], key[2][:13], len(steps), wall / 60, steps.mean(), np.percentile(steps, 95), loop['rss_mb'], shares))
+        for name, seconds in loop['phases'].items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        results[key] = {'iterations': len(steps), 'wall_s': wall, 'mean_s': float(steps.mean()),
+                        'p95_s': float(np.percentile(steps, 95)), 'rss_mb': loop['rss_mb'], 'phases': loop['phases']}
+    total = sum(phases.values())
+    print('\nTime in every phase, all the loops:')
+    for name, seconds in sorted(phases.items(), key=lambda p: -p[1]):
+        print('{:<16}{:>12.2f} min{:>8}%'.format(name, seconds / 60, int(round(100 * seconds / max(total, 1e-9)))))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report where the time goes in the telemetry of a run.')
+    parser.add_argument('paths', nargs='*', default=[log_path], help='JSON lines files or folders, log_path by default')
+    args = parser.parse_args()
+    report(load_events(args.paths))
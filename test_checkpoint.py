@@ -0,0 +1,56 @@
+'''
+Checks of the checkpoints of the merge sequence, run with pytest.
+'''
+import random
+import numpy as np
+import pytest
+import connect_engine
+from checkpoint import Checkpoint
+from test_routing import random_layer
+
+
+def test_save_load(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / 'city.checkpoint.json'), interval=3600)
+    assert checkpoint.load() is None
+    checkpoint.save([0, 12.5], [0, 3], [0, 0.25], [0, np.int64(7)], [0, np.int64(9)], random_state=[3, [1, 2], None])
+    checkpoint.update([0, 12.5, 20.0], [0, 3, 5], [0, 0.25, 0.5], [0, 7, 1], [0, 9, 4])  # Within the interval, not saved
+    state = checkpoint.load()
+    assert state['delta'] == [0, 12.5] and state['i'] == [0, 7] and not state['done']
+    assert state['random_state'] == [3, [1, 2], None]
+    assert checkpoint.links(state) == [(7, 9)]
+    assert not (tmp_path / 'city.checkpoint.json.tmp').exists()
+    checkpoint.remove()
+    assert checkpoint.load() is None
+
+
+class Stop(Exception):
+    pass
+
+
+@pytest.mark.parametrize('algorithm', sorted(connect_engine.strategies))
+def test_resume(algorithm, tmp_path):
+    # A run stopped in the middle and continued from its checkpoint gives the sequence of a run without stops
+    G = random_layer(150, 90, seed=6)
+    engine = connect_engine.ConnectEngine(G)
+    random.seed(7)
+    expected = engine.run(connect_engine.strategies[algorithm](), max_delta=np.inf)
+    checkpoint = Checkpoint(str(tmp_path / 'city.checkpoint.json'), interval=0)
+    random.seed(7)
+    strategy = connect_engine.strategies[algorithm]()
+    next_link = strategy.next_link
+    calls = []
+
+    def stopped():
+        calls.append(1)
+        if len(calls) > len(expected[0]) // 2:
+            raise Stop()
+        return next_link()
+
+    strategy.next_link = stopped
+    with pytest.raises(Stop):
+        engine.run(strategy, max_delta=np.inf, checkpoint=checkpoint)
+    random.seed(8)  # The random state comes from the checkpoint
+    resumed = engine.run(connect_engine.strategies[algorithm](), max_delta=np.inf, checkpoint=checkpoint)
+    assert checkpoint.load()['done']
+    for found, values in zip(resumed, expected):
+        assert np.allclose(found, values, rtol=1e-12)
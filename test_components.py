@@ -0,0 +1,75 @@
+'''
+Checks of the ComponentTracker against the components networkx finds in the layer with the new links, run with pytest.
+'''
+import networkx as nx
+import numpy as np
+import pytest
+from components import ComponentTracker
+from test_routing import new_links, random_layer
+
+
+def shuffled_layer(seed):
+    # Directed layer with ids that are not the positions of the nodes, as the OSM ids
+    G = random_layer(150, 90, seed=seed, directed=True)
+    ids = (10**9 + np.random.default_rng(seed).permutation(len(G))).tolist()
+    return nx.relabel_nodes(G, dict(enumerate(ids)))
+
+
+def expected_components(G):
+    # Order of the original scripts: sorted(nx.weakly_connected_component_subgraphs(G), key=len, reverse=True),
+    # the components are generated in the order of their first node and the sort is stable
+    return sorted(nx.weakly_connected_components(G), key=len, reverse=True)
+
+
+def check(G, tracker, key):
+    components = expected_components(G)
+    ranking = tracker.ranking()
+    assert len(tracker) == len(components)
+    assert [set(key[n] for n in c) for c in components] == [set(tracker.nodes(r)) for r in ranking]
+    for c, r in zip(components, ranking):
+        nodes = list(c)
+        assert tracker.size[r] == len(c)
+        assert np.isclose(tracker.length[r], G.subgraph(nodes).size(weight='length') / 1000, rtol=1e-12)
+        xs = [G.nodes[n]['x'] for n in nodes]
+        ys = [G.nodes[n]['y'] for n in nodes]
+        assert tracker.bbox[r] == (min(xs), min(ys), max(xs), max(ys))
+    # The heap holds the stale entries of the merged components
+    assert tracker.top(len(ranking) + 5) == ranking
+    assert tracker.largest() == ranking[0]
+    assert tracker.second_largest() == (ranking[1] if len(ranking) > 1 else None)
+
+
+@pytest.mark.parametrize('by_position', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_random_unions(by_position, seed):
+    G = shuffled_layer(seed)
+    key = {n: k if by_position else n for k, n in enumerate(G)}
+    tracker = ComponentTracker(G, by_position=by_position)
+    check(G, tracker, key)
+    for k, (u, v, length) in enumerate(new_links(G, 200, seed=seed + 10)):
+        connected = nx.has_path(G.to_undirected(as_view=True), u, v)
+        root = tracker.union(key[u], key[v], length=length)
+        assert (root is None) == connected
+        assert tracker.connected(key[u], key[v])
+        if G.has_edge(u, v):
+            length += G[u][v]['length']  # Keep the total length in a DiGraph without parallel links
+        G.add_edge(u, v, length=length)
+        if k % 20 == 0 or len(tracker) < 4:
+            check(G, tracker, key)
+    check(G, tracker, key)
+
+
+def test_ties():
+    # Equal sizes are ranked by the position of their first node in G, not by their ids
+    G = nx.MultiDiGraph()
+    G.add_nodes_from([(n, {'x': float(n), 'y': 0.0}) for n in [50, 10, 40, 20, 30, 60]])
+    G.add_edge(40, 20, length=100.0)
+    G.add_edge(60, 30, length=300.0)
+    tracker = ComponentTracker(G)
+    assert [sorted(tracker.nodes(r)) for r in tracker.ranking()] == [[20, 40], [30, 60], [50], [10]]
+    assert sorted(tracker.nodes(tracker.largest())) == [20, 40]
+    tracker.union(50, 10, length=1000.0)
+    tracker.union(30, 20)  # Merge the two largest, the pair 50-10 is second
+    assert sorted(tracker.nodes(tracker.second_largest())) == [10, 50]
+    assert tracker.length[tracker.largest()] == pytest.approx(0.4)
+    assert tracker.bbox[tracker.largest()] == (20.0, 0.0, 60.0, 0.0)
@@ -0,0 +1,94 @@
+'''
+Checks of the merge strategies against brute force versions of the original scripts, run with pytest.
+'''
+import random
+import numpy as np
+import pandas as pd
+import pytest
+import connect_engine
+import telemetry
+from components import ComponentTracker
+from sequence import MergeSequence
+from test_routing import random_layer
+
+
+def brute_force(G, pick):
+    '''
+    Sequence of links computing the distance between every pair of nodes at every step.
+    ---
+    pick: function pick(tracker) -> np.array bool of the nodes on one side of the next link (the other side are
+          the nodes outside their components)
+
+    returns: lists delta and links {i, j}
+    '''
+    coords = np.array([(d['y'], d['x']) for n, d in G.nodes(data=True)])
+    dist = ((coords[:, None, :] - coords[None, :, :]) ** 2).sum(axis=2) ** 0.5
+    tracker = ComponentTracker(G, by_position=True)
+    delta, links = [0], []
+    while len(tracker) > 1:
+        roots = np.array([tracker.find(p) for p in range(len(coords))])
+        side = pick(tracker)
+        other = roots[None, :] != roots[:, None]
+        masked = np.where(side[:, None] & other, dist, np.inf)
+        i, j = np.unravel_index(np.argmin(masked), masked.shape)
+        tracker.union(i, j)
+        delta.append(delta[-1] + dist[i, j])
+        links.append({int(i), int(j)})
+    return delta, links
+
+
+def engine_sequence(G, strategy):
+    delta, nodes_cc, length_cc, i_s, j_s = connect_engine.ConnectEngine(G).run(strategy, max_delta=np.inf)
+    return delta, [{int(i), int(j)} for i, j in zip(i_s[1:], j_s[1:])]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_min_delta(seed):
+    # The closest pair of nodes between any two components at every step
+    G = random_layer(200, 120, seed=seed)
+    expected = brute_force(G, lambda tracker: np.ones(len(G), dtype=bool))
+    delta, links = engine_sequence(G, connect_engine.MinDelta())
+    assert np.allclose(delta, expected[0], rtol=1e-12)
+    assert links == expected[1]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_greedy_min(seed):
+    # The closest node outside the largest component to any of its nodes at every step
+    G = random_layer(200, 120, seed=seed)
+    start = ComponentTracker(G, by_position=True)
+    largest = start.largest()
+    expected = brute_force(G, lambda tracker: np.array([tracker.find(p) == tracker.find(largest) for p in range(len(G))]))
+    delta, links = engine_sequence(G, connect_engine.GreedyMin())
+    assert np.allclose(delta, expected[0], rtol=1e-12)
+    assert links == expected[1]
+
+
+@pytest.mark.parametrize('algorithm', sorted(connect_engine.strategies))
+def test_csv_round_trip(algorithm, tmp_path, monkeypatch):
+    # The sequences written by main are read back by the Directness scripts
+    G = random_layer(120, 80, seed=4)
+    monkeypatch.setattr(connect_engine, 'load_graph', lambda name, layer: G)
+    monkeypatch.setattr(connect_engine, 'output_path', str(tmp_path) + '/')
+    monkeypatch.setattr(telemetry, 'log_path', None)
+    random.seed(5)  # Same picks of the random strategy in both runs
+    connect_engine.main('Test', [algorithm])
+    strategy = connect_engine.strategies[algorithm]
+    sequence = MergeSequence.from_csv(str(tmp_path / 'Test_CC_data_{}.csv'.format(strategy.suffix)))
+    random.seed(5)
+    expected = connect_engine.ConnectEngine(G).run(strategy())
+    assert list(sequence.df.columns) == ['delta', 'nodes_cc', 'length_cc', 'i', 'j']
+    for column, values in zip(sequence.df.columns, expected):
+        assert np.allclose(sequence.df[column].values, values, rtol=1e-12)
+
+
+def test_csv_legacy(tmp_path):
+    # Files of the original scripts, with the letter n at the end of every line
+    df = pd.DataFrame([[0, 0, 0, 0, 0], [12.5, 30, 900.25, 7, 11], [40.0, 55, 1500.5, 3, 8]],
+                      columns=['delta', 'nodes_cc', 'length_cc', 'i', 'j'])
+    path = str(tmp_path / 'legacy.csv')
+    with open(path, 'w') as f:
+        f.write(df.to_csv().replace('\n', 'n'))
+    sequence = MergeSequence.from_csv(path)
+    assert np.array_equal(sequence.df.values, df.values)
+    assert sequence.state(20)['links'] == 1
@@ -0,0 +1,50 @@
+'''
+Checks of the contraction hierarchy against scipy's Dijkstra on the whole layer, run with pytest.
+'''
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+import hierarchy
+from hierarchy import ContractionHierarchy
+from routing import CSRGraph
+from test_routing import random_layer
+
+
+def check(G, seed):
+    ch = ContractionHierarchy.build(G)
+    layer = CSRGraph(G)
+    full = dijkstra(layer.csr, directed=True)
+    rng = np.random.default_rng(seed)
+    pairs = [tuple(p) for p in rng.integers(0, len(G), size=(400, 2)).tolist()]
+    expected = full[[layer.index[s] for s, t in pairs], [layer.index[t] for s, t in pairs]]
+    assert np.allclose(ch.pair_distances(pairs), expected, rtol=1e-12)
+    return ch
+
+
+@pytest.mark.parametrize('directed', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_same_distances(directed, seed):
+    # Fragmented (some pairs without a path) and connected layers
+    check(random_layer(150, 150, seed=seed, directed=directed), seed)
+    check(random_layer(150, 300, seed=seed, directed=directed, connected=True), seed)
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_witness_limit(directed, monkeypatch):
+    # The local searches stop before finding the witnesses, the extra shortcuts must not change the distances
+    monkeypatch.setattr(hierarchy, 'witness_settled', 2)
+    G = random_layer(120, 300, seed=3, directed=directed, connected=True)
+    ch = check(G, 4)
+    monkeypatch.setattr(hierarchy, 'witness_settled', 60)
+    assert len(ch.up[1]) > len(ContractionHierarchy.build(G).up[1])  # More shortcuts with the limit
+
+
+def test_save_load(tmp_path):
+    G = random_layer(80, 160, seed=5, directed=True)
+    ch = ContractionHierarchy.build(G, source='abc')
+    path = str(tmp_path / 'layer_ch.npz')
+    ch.save(path)
+    loaded = ContractionHierarchy.load(path)
+    pairs = [(s, t) for s in range(0, 80, 7) for t in range(80)]
+    assert loaded.source == 'abc' and loaded.directed
+    assert np.array_equal(loaded.pair_distances(pairs), ch.pair_distances(pairs))
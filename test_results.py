@@ -0,0 +1,44 @@
+'''
+Checks of the resumable CSV files of results.py, run with pytest.
+'''
+import pytest
+from results import ResultWriter
+
+columns = ['', 'delta', 'efficiency']
+
+
+def test_resume(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    writer = ResultWriter(path, columns)
+    writer.write([0, 0.0, 0.5])
+    writer.write([1, 10.0, 0.25])
+    writer.close()
+    with open(path, 'a') as f:
+        f.write('2,20.0,0.1')  # The run stopped while writing the third row
+    writer = ResultWriter(path, columns)
+    assert writer.rows == 2
+    writer.write([2, 20.0, 0.125])
+    assert writer.read()['efficiency'].tolist() == [0.5, 0.25, 0.125]
+
+
+def test_resume_half_header(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    with open(path, 'w') as f:
+        f.write(',delta,eff')
+    writer = ResultWriter(path, columns)
+    assert writer.rows == 0
+    writer.write([0, 0.0, 0.5])
+    assert writer.read()['efficiency'].tolist() == [0.5]
+
+
+@pytest.mark.parametrize('content', [',delta,efficiencyn0,0.0,0.5n1,10.0,0.25n',  # Lines ending with the letter n
+                                     ',delta,coverage\n0,0.0,0.5\n1,10.0,0.2'])  # Other columns, half written row
+def test_resume_wrong_format(tmp_path, content):
+    # The file is kept as it is for the user to move it away
+    path = str(tmp_path / 'results.csv')
+    with open(path, 'w', newline='') as f:
+        f.write(content)
+    with pytest.raises(ValueError):
+        ResultWriter(path, columns)
+    with open(path, newline='') as f:
+        assert f.read() == content
@@ -0,0 +1,122 @@
+'''
+Checks of the searches of routing.py against scipy's Dijkstra on the whole layer, run with pytest.
+'''
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+from components import ComponentTracker
+from routing import CSRGraph, DistanceMatrix, SeedDistances, distances_from, pair_distances
+
+
+def random_layer(n, links, seed, directed=False, connected=False, stretch=None):
+    '''
+    Random layer with projected coordinates and links with a length proportional to the distance between their ends.
+    ---
+    connected: bool start with a path through all the nodes, so every node reaches every other one
+    stretch: float length of every link / distance between its ends, random from 1 to 2 by default
+    '''
+    rng = np.random.default_rng(seed)
+    G = nx.DiGraph() if directed else nx.Graph()
+    coords = rng.random((n, 2)) * 1000
+    G.add_nodes_from((k, {'y': float(y), 'x': float(x)}) for k, (y, x) in enumerate(coords))
+    ends = rng.integers(0, n, size=(links, 2)).tolist()
+    if connected:
+        order = rng.permutation(n).tolist()
+        ends += list(zip(order[:-1], order[1:])) + ([(order[-1], order[0])] if directed else [])
+    for a, b in ends:
+        if a != b:
+            G.add_edge(a, b, length=float(np.hypot(*(coords[a] - coords[b])) * (1 + rng.random() if stretch is None else stretch)))
+    return G
+
+
+def new_links(G, count, seed):
+    rng = np.random.default_rng(seed)
+    nodes = list(G)
+    links = []
+    while len(links) < count:
+        a, b = rng.choice(len(nodes), 2, replace=False).tolist()
+        links.append((nodes[a], nodes[b], float(rng.random() * 300)))
+    return links
+
+
+def all_pairs(G):
+    layer = CSRGraph(G)
+    return dijkstra(layer.csr, directed=True)
+
+
+@pytest.mark.parametrize('directed', [False, True])
+@pytest.mark.parametrize('connected', [False, True])
+def test_distance_matrix_add_edge(directed, connected):
+    G = random_layer(60, 40 if not connected else 80, seed=1, directed=directed, connected=connected)
+    matrix = DistanceMatrix(G, max_bytes=8 * 60 * 7)  # Blocks of a few rows
+    for u, v, length in new_links(G, 8, seed=2):
+        matrix.add_edge(u, v, length)
+        G.add_edge(u, v, length=min(length, G[u][v]['length']) if G.has_edge(u, v) else length)
+        assert np.allclose(matrix.distances, all_pairs(G), rtol=1e-12)
+
+
+@pytest.mark.parametrize('method', ['astar', 'alt'])
+def test_astar_shorter_than_projection(method):
+    # Links 1.5% shorter than the distance between their ends, as the great circle lengths of osmnx against a UTM
+    # projection far from its central meridian
+    G = random_layer(300, 900, seed=3, directed=True, connected=True, stretch=1 / 1.015)
+    layer = CSRGraph(G)
+    rng = np.random.default_rng(4)
+    pairs = [tuple(p) for p in rng.integers(0, 300, size=(200, 2)).tolist()]
+    assert np.allclose(layer.pair_distances(pairs, method), layer.pair_distances(pairs), rtol=1e-12)
+    for u, v, length in new_links(G, 5, seed=5):
+        layer.add_edge(u, v, length / 1.1)
+    assert np.allclose(layer.pair_distances(pairs, method), layer.pair_distances(pairs), rtol=1e-12)
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_csr_new_links(directed):
+    # The links added one by one, with searches in between, give the adjacency of the layer built with them
+    G = random_layer(80, 120, seed=6, directed=directed)
+    layer = CSRGraph(G)
+    overlay = layer.overlay()
+    before = layer.csr.toarray()
+    for k, (u, v, length) in enumerate(new_links(G, 30, seed=7)):
+        length = length if k % 3 else 0.0  # Links of length 0 are kept as explicit zeros
+        overlay.add_edge(u, v, length)
+        if k % 2:
+            overlay.add_edge(u, v, length + 1)  # A longer parallel link is ignored
+        G.add_edge(u, v, length=min(length, G[u][v]['length']) if G.has_edge(u, v) else length)
+        if k % 4 == 0:
+            assert np.allclose(overlay.pair_distances([(u, w) for w in G]), dijkstra(CSRGraph(G).csr, indices=u))
+    expected = CSRGraph(G).csr
+    assert overlay.csr.nnz == expected.nnz
+    assert np.array_equal(overlay.csr.indptr, expected.indptr) and np.array_equal(overlay.csr.indices, expected.indices)
+    assert np.array_equal(overlay.csr.data, expected.data)
+    assert np.array_equal(layer.csr.toarray(), before)  # The overlay never writes the arrays of its layer
+
+
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_distances_from_targets(directed):
+    # Same distances in a CSRGraph and in the networkx layer, targets without a path are missing
+    G = random_layer(200, 150, seed=8, directed=directed)
+    layer = CSRGraph(G)
+    rng = np.random.default_rng(9)
+    for source in rng.integers(0, 200, size=20).tolist():
+        targets = rng.choice(200, 15, replace=False).tolist()
+        expected = distances_from(G, source, targets)
+        found = distances_from(layer, source, targets)
+        assert found.keys() == {t for t in targets if t in expected}
+        assert all(np.isclose(found[t], expected[t], rtol=1e-12) for t in found)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_seed_distances_add_edge(compiled):
+    # The distances updated with every new link are the ones searched again in the layer with the links
+    G = random_layer(150, 120, seed=10)
+    rng = np.random.default_rng(11)
+    pairs = [tuple(p) for p in rng.choice(150, size=(100, 2)).tolist() if p[0] != p[1]]
+    components = ComponentTracker(G)
+    paths = SeedDistances(CSRGraph(G) if compiled else G.copy(), pairs, components)
+    for u, v, length in new_links(G, 25, seed=12):
+        components.union(u, v)
+        paths.add_edge(u, v, length)
+        G.add_edge(u, v, length=min(length, G[u][v]['length']) if G.has_edge(u, v) else length)
+        assert np.allclose(paths.distances, pair_distances(G, pairs), rtol=1e-12)
@@ -0,0 +1,55 @@
+'''
+Checks of the grid index of spatial.py against a brute force search over all the pairs of points, run with pytest.
+'''
+import numpy as np
+import pytest
+import spatial
+from spatial import GridIndex
+
+
+def brute_force(coords, labels, idx):
+    others = np.flatnonzero(labels != labels[idx[0]])
+    d = ((coords[idx][:, None, :] - coords[others][None, :, :]) ** 2).sum(axis=2) ** 0.5
+    return d.min()
+
+
+def check(grid, coords, idx):
+    best, i, j = grid.closest_foreign(idx)
+    assert np.isclose(best, brute_force(coords, grid.labels, idx), rtol=1e-12)
+    assert i in idx and grid.labels[j] != grid.labels[i]
+    assert np.isclose(np.hypot(*(coords[i] - coords[j])), best, rtol=1e-12)
+
+
+@pytest.mark.parametrize('ratio', [0, 64, 10**9])  # Only rings, both searches and only KD-trees
+@pytest.mark.parametrize('seed', [0, 1])
+def test_closest_foreign(ratio, seed, monkeypatch):
+    monkeypatch.setattr(spatial, 'tree_ratio', ratio)
+    rng = np.random.default_rng(seed)
+    coords = rng.random((600, 2)) * 1000
+    coords[:200] = coords[:200] * [0.05, 1] + [300, 0]  # A dense strip, cells of very different loads
+    labels = rng.integers(0, 80, size=600)
+    labels[rng.random(600) < 0.4] = 80  # One large component
+    grid = GridIndex(coords, labels)
+    for label in np.unique(labels).tolist():
+        check(grid, coords, np.flatnonzero(grid.labels == label))
+    for k in range(70):  # Merge the components into the largest one
+        grid.relabel(np.flatnonzero(grid.labels == k), 80)
+        if k % 10 == 0:
+            check(grid, coords, np.flatnonzero(grid.labels == 80))
+            check(grid, coords, np.flatnonzero(grid.labels == 75))
+
+
+@pytest.mark.parametrize('ratio', [0, 10**9])
+def test_degenerate_layouts(ratio, monkeypatch):
+    # Points in a line and points in the same place
+    monkeypatch.setattr(spatial, 'tree_ratio', ratio)
+    rng = np.random.default_rng(2)
+    line = np.column_stack([np.zeros(100), rng.random(100) * 500])
+    same = np.concatenate([line[:50], line[:50]])
+    for coords in [line, same]:
+        labels = rng.integers(0, 5, size=len(coords))
+        grid = GridIndex(coords, labels)
+        for label in np.unique(labels).tolist():
+            check(grid, coords, np.flatnonzero(labels == label))
+    grid = GridIndex(line, np.zeros(100, dtype=int))
+    assert grid.closest_foreign(list(range(100))) == (np.inf, None, None)